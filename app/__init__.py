@@ -1,22 +1,28 @@
 import os
-from flask import Flask, redirect, url_for, flash
+from flask import Flask, g, redirect, session, url_for, flash
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager, current_user
 from flask_wtf.csrf import CSRFProtect, generate_csrf
+from jinja2 import FileSystemBytecodeCache
 from datetime import datetime
 import click
+from .branches import BranchRouter, BranchSession, parse_user_session_id
+from .reporting import configure_reporting_binds, init_reporting
 
 # Inicialización de extensiones
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': BranchSession})
+branch_router = BranchRouter()
 migrate = Migrate()
 login_manager = LoginManager()
 csrf = CSRFProtect()
 
 DB_NAME = "bar_app.db"
 
-def create_app():
-    app = Flask(__name__, 
+def create_app(instance_path=None):
+    # instance_path: carpeta de las bases de datos y demás archivos locales (los tests usan una temporal)
+    app = Flask(__name__,
+                instance_path=instance_path,
                 instance_relative_config=True, 
                 static_folder='static', 
                 template_folder='templates')
@@ -27,12 +33,42 @@ def create_app():
     os.makedirs(app.instance_path, exist_ok=True)
     app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(app.instance_path, DB_NAME)}'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Debe ir antes de db.init_app: registra una base de datos (bind) por sucursal
+    branch_router.init_app(app)
+    configure_reporting_binds(app)
+
+    # Caché de bytecode de Jinja: los workers nuevos no vuelven a compilar las plantillas
+    jinja_cache_dir = os.path.join(app.instance_path, 'jinja_cache')
+    os.makedirs(jinja_cache_dir, exist_ok=True)
+    app.jinja_options = {**app.jinja_options, 'bytecode_cache': FileSystemBytecodeCache(jinja_cache_dir)}
     
     db.init_app(app)
+    init_reporting(app, db)
     migrate.init_app(app, db)
     login_manager.init_app(app)
     csrf.init_app(app)
 
+    from .cache import init_cache
+    init_cache(app)
+    from .compression import init_compression
+    init_compression(app)
+    from .assets import init_assets
+    init_assets(app)
+    from .jobs import init_jobs
+    init_jobs(app)
+    from .inventory import init_inventory
+    init_inventory(app)
+    from .printing import init_printing
+    init_printing(app)
+    from .order_items import init_order_items
+    init_order_items(app)
+    from .backup import init_backup
+    init_backup(app)
+    from .streams import init_streams
+    init_streams(app)
+    from .profiling import init_profiling
+    init_profiling(app)
+
     login_manager.login_view = 'auth.login'
     login_manager.login_message = 'Por favor, inicie sesión para acceder a esta página.'
     login_manager.login_message_category = 'info'
@@ -51,12 +87,27 @@ def create_app():
     app.register_blueprint(auth_bp, url_prefix='/auth')
     app.register_blueprint(admin_bp, url_prefix='/admin')
     app.register_blueprint(mozo_bp, url_prefix='/mozo')
+
+    from .warmup import health_bp
+    app.register_blueprint(health_bp)
+    from .pickup import pickup_bp
+    app.register_blueprint(pickup_bp)
     
     from .models import User, Product, Table, Order
+    from .cache import user_cache
 
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        # La sucursal sale del id y no de la sesión: sin sesión (p. ej. solo con la cookie
+        # "recordarme") se caería en la sucursal por defecto y el id sería el de otro usuario.
+        code, user_id = parse_user_session_id(user_id)
+        if code is None:
+            # Id sin sucursal de una sesión iniciada antes del cambio: solo vale con la sucursal de la sesión
+            code = session.get('branch')
+        if code not in branch_router.branches or not user_id.isdigit():
+            return None
+        g.branch = session['branch'] = code
+        return user_cache.get(int(user_id))
 
     @app.cli.command("seed-db")
     def seed_db_command():
@@ -66,7 +117,7 @@ def create_app():
                 print("La base de datos ya tiene datos. Abortando.")
                 return
 
-            print("Base de datos vacía. Creando datos iniciales...")
+            print(f"Base de datos de la sucursal '{branch_router.current()}' vacía. Creando datos iniciales...")
             
             # Crear usuarios
             admin = User(username="admin", role='admin')
@@ -1,11 +1,19 @@
 # Archivo: app/admin.py
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
-from .models import Product, Order, OrderItem, Table, User
-from . import db
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, send_from_directory, abort, current_app
+from .models import Product, Order, OrderItem, Table, User, Job, StockMovement, load_items_with_products
+from . import db, branch_router
 from .utils import admin_required
-from datetime import datetime, date
-from collections import OrderedDict
+from .reporting import reporting_view
+from . import events
+from . import inventory
+from . import profiling
+from .profiling import query_budget
+from .jobs import JOB_FAILED, JOB_PENDING, enqueue
+from datetime import datetime, date, timedelta
+from collections import OrderedDict, Counter
 from sqlalchemy import func
+from sqlalchemy.orm import joinedload
+from sqlalchemy.orm.exc import StaleDataError
 from flask_login import current_user
 
 admin_bp = Blueprint('admin', __name__)
@@ -17,9 +25,8 @@ def get_distinct_categories():
     db_categories = [category[0] for category in db_categories_query if category[0]]
     return sorted(list(set(db_categories)))
 
-@admin_bp.route('/dashboard')
-@admin_required
-def dashboard():
+def get_dashboard_stats(top_limit=5):
+    """Agregados del dashboard para la sucursal activa. Con top_limit=None se devuelven todos los productos."""
     today = date.today()
     
     # Ventas del día
@@ -33,25 +40,58 @@ def dashboard():
         .filter(db.func.date(Order.updated_at) == today, Order.status == 'Pagado', Order.type == 'Para Llevar').scalar() or 0.0
     
     # Pedidos activos y mesas ocupadas
-    active_orders_count = Order.query.filter(Order.status.in_(['Activo', 'Pendiente'])).count()
+    active_orders_count = Order.query.filter(Order.status.in_(['Activo', 'Pendiente', 'Listo'])).count()
     tables_occupied_count = Table.query.filter(Table.status == 'Ocupada').count()
     
     # Top 5 productos más vendidos (histórico)
     top_products = db.session.query(
         Product.name,
         func.sum(OrderItem.quantity).label('total_quantity')
-    ).join(OrderItem).group_by(Product.name).order_by(func.sum(OrderItem.quantity).desc()).limit(5).all()
+    ).join(OrderItem).group_by(Product.name).order_by(func.sum(OrderItem.quantity).desc()).limit(top_limit).all()
 
-    return render_template('admin/dashboard.html', 
-        title="Panel de Administrador",
+    return dict(
         total_sales_today=total_sales_today,
         sales_today_table=sales_today_table,
         sales_today_takeaway=sales_today_takeaway,
         active_orders_count=active_orders_count,
         tables_occupied_count=tables_occupied_count,
-        top_products=top_products
+        top_products=[{'name': name, 'total_quantity': quantity} for name, quantity in top_products]
+    )
+
+@admin_bp.route('/dashboard')
+@admin_required
+@reporting_view
+def dashboard():
+    return render_template('admin/dashboard.html', 
+        title="Panel de Administrador",
+        multi_branch=branch_router.is_multi_branch(),
+        **get_dashboard_stats()
     )
 
+@admin_bp.route('/branches')
+@admin_required
+@reporting_view
+def branches_overview():
+    # Cada sucursal se consulta en su propio hilo y contra su propio archivo de base de datos
+    stats_by_branch = branch_router.run_parallel(lambda: get_dashboard_stats(top_limit=None))
+
+    totals = {key: sum(stats[key] for stats in stats_by_branch.values())
+              for key in ('total_sales_today', 'sales_today_table', 'sales_today_takeaway',
+                          'active_orders_count', 'tables_occupied_count')}
+
+    product_totals = Counter()
+    for stats in stats_by_branch.values():
+        for product in stats['top_products']:
+            product_totals[product['name']] += product['total_quantity']
+    top_products = [{'name': name, 'total_quantity': quantity} for name, quantity in product_totals.most_common(5)]
+
+    return render_template('admin/branches_overview.html',
+                           title="Vista Consolidada de Sucursales",
+                           stats_by_branch=stats_by_branch,
+                           branch_names=branch_router.branches,
+                           totals=totals,
+                           top_products=top_products)
+
 @admin_bp.route('/products')
 @admin_required
 def products():
@@ -71,6 +111,7 @@ def products():
 
     return render_template('admin/products.html', 
                            products_on_page=products_on_page, 
+                           stock_levels=inventory.stock_levels([product.id for product in products_on_page]),
                            title="Gestionar Productos", 
                            pagination=pagination, 
                            search_name_value=search_name,
@@ -98,8 +139,11 @@ def add_product():
         try:
             price = float(price_str)
             stock = int(stock_str)
-            new_product = Product(name=name, price=price, type=product_type, stock=stock)
+            new_product = Product(name=name, price=price, type=product_type, stock=0)
             db.session.add(new_product)
+            db.session.flush()
+            if stock:
+                inventory.adjust(new_product.id, stock, kind=inventory.IMPORT, note='Stock inicial')
             db.session.commit()
             flash('Producto añadido con éxito.', 'success')
             return redirect(url_for('admin.products'))
@@ -114,6 +158,7 @@ def add_product():
 def edit_product(product_id):
     product = Product.query.get_or_404(product_id)
     distinct_categories = get_distinct_categories()
+    on_hand = inventory.stock_level(product.id).on_hand
     if request.method == 'POST':
         name = request.form.get('name', '').strip()
         price_str = request.form.get('price')
@@ -124,7 +169,7 @@ def edit_product(product_id):
         if product_type == 'Otro':
             if not new_category:
                 flash('Debe especificar el nombre de la nueva categoría.', 'danger')
-                return render_template('admin/product_form.html', action="Editar", product=product, title=f"Editar {product.name}", categories=distinct_categories)
+                return render_template('admin/product_form.html', action="Editar", product=product, stock_on_hand=on_hand, title=f"Editar {product.name}", categories=distinct_categories)
             product.type = new_category
         else:
             product.type = product_type
@@ -132,7 +177,10 @@ def edit_product(product_id):
         try:
             product.name = name
             product.price = float(price_str)
-            product.stock = int(stock_str)
+            # El stock no se pisa: la diferencia con las existencias actuales queda como ajuste
+            delta = int(stock_str) - on_hand
+            if delta:
+                inventory.adjust(product.id, delta, note='Edición del producto')
             db.session.commit()
             flash('Producto actualizado con éxito.', 'success')
             return redirect(url_for('admin.products'))
@@ -140,7 +188,7 @@ def edit_product(product_id):
             db.session.rollback()
             flash(f'Ocurrió un error al editar el producto: {str(e)}', 'danger')
     
-    return render_template('admin/product_form.html', action="Editar", product=product, title=f"Editar {product.name}", categories=distinct_categories)
+    return render_template('admin/product_form.html', action="Editar", product=product, stock_on_hand=on_hand, title=f"Editar {product.name}", categories=distinct_categories)
 
 @admin_bp.route('/products/delete/<int:product_id>', methods=['POST'])
 @admin_required
@@ -155,13 +203,82 @@ def delete_product(product_id):
         flash(f'Error al eliminar el producto: {str(e)}', 'danger')
     return redirect(url_for('admin.products'))
 
+@admin_bp.route('/inventory')
+@admin_required
+@reporting_view
+def inventory_view():
+    threshold = request.args.get('threshold', current_app.config['LOW_STOCK_THRESHOLD'], type=int)
+    show_all = request.args.get('all') == '1'
+    if show_all:
+        levels = inventory.stock_levels()
+        rows = sorted(((product, levels[product.id]) for product in Product.query.all() if product.id in levels),
+                      key=lambda row: (row[1].available, row[0].name))
+    else:
+        rows = inventory.low_stock_products(threshold)
+
+    position = inventory.ledger_position()
+    pending_movements = db.session.query(func.count(StockMovement.id)).filter(StockMovement.id > position).scalar()
+    return render_template('admin/inventory.html',
+                           rows=rows,
+                           threshold=threshold,
+                           show_all=show_all,
+                           pending_movements=pending_movements,
+                           ledger_position=position,
+                           title="Inventario")
+
+@admin_bp.route('/inventory/compact', methods=['POST'])
+@admin_required
+def compact_inventory():
+    enqueue('compact_stock_ledger')
+    flash('Compactación del libro de stock encolada.', 'success')
+    return redirect(url_for('admin.inventory_view'))
+
+@admin_bp.route('/inventory/<int:product_id>')
+@admin_required
+@reporting_view
+def inventory_product(product_id):
+    product = Product.query.get_or_404(product_id)
+    page = request.args.get('page', 1, type=int)
+    pagination = StockMovement.query.options(joinedload(StockMovement.user))\
+        .filter_by(product_id=product.id)\
+        .order_by(StockMovement.id.desc())\
+        .paginate(page=page, per_page=ITEMS_PER_PAGE, error_out=False)
+    return render_template('admin/inventory_product.html',
+                           product=product,
+                           level=inventory.stock_level(product.id),
+                           pagination=pagination,
+                           kind_labels=inventory.KIND_LABELS,
+                           title=f"Inventario: {product.name}")
+
+@admin_bp.route('/inventory/<int:product_id>/adjust', methods=['POST'])
+@admin_required
+def adjust_inventory(product_id):
+    product = Product.query.get_or_404(product_id)
+    kind = request.form.get('kind')
+    quantity = request.form.get('quantity', type=int)
+    note = request.form.get('note', '').strip()
+
+    if kind not in (inventory.ADJUSTMENT, inventory.IMPORT) or not quantity:
+        flash('Indique el tipo de movimiento y una cantidad distinta de cero.', 'danger')
+    elif kind == inventory.IMPORT and quantity < 0:
+        flash('Un ingreso de mercadería no puede ser negativo; use un ajuste.', 'danger')
+    elif kind == inventory.ADJUSTMENT and not note:
+        flash('Los ajustes manuales requieren un motivo.', 'danger')
+    else:
+        inventory.adjust(product.id, quantity, kind=kind, note=note or None)
+        db.session.commit()
+        flash(f'Movimiento registrado para {product.name}.', 'success')
+    return redirect(url_for('admin.inventory_product', product_id=product.id))
+
 @admin_bp.route('/sales')
 @admin_required
+@reporting_view
+@query_budget(7)
 def sales_log():
     page = request.args.get('page', 1, type=int)
     date_filter_str = request.args.get('date', '').strip()
     
-    query = Order.query.filter(Order.status.in_(['Pagado', 'Venta Anulada']))
+    query = Order.query.options(joinedload(Order.table_assigned)).filter(Order.status.in_(['Pagado', 'Venta Anulada']))
     
     date_filter = None
     if date_filter_str:
@@ -193,10 +310,87 @@ def sales_log():
                            total_sales_takeaway=total_sales_takeaway)
 
 
+def date_arg(name, default):
+    value = request.args.get(name, '').strip()
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else default
+
+def get_waiter_stats(start, end):
+    """Ventas, tickets, ticket promedio y demora hasta el cobro por mozo en [start, end).
+
+    Cada métrica sale de una sola consulta agrupada (sin una consulta por mozo). Las ventas
+    se atribuyen a quien abrió el pedido; los cobros y los ítems, a quien los registró.
+    """
+    # Rango sobre paid_at (no date(paid_at)) para que use el índice (paid_at, opened_by_id)
+    paid_in_range = (Order.status == 'Pagado', Order.paid_at >= start, Order.paid_at < end)
+    seconds_to_payment = (func.julianday(Order.paid_at) - func.julianday(Order.created_at)) * 86400
+
+    sales = db.session.query(
+        Order.opened_by_id,
+        func.count(Order.id),
+        func.sum(Order.total_amount),
+        func.avg(seconds_to_payment)
+    ).filter(*paid_in_range).group_by(Order.opened_by_id).all()
+    payments = dict(db.session.query(Order.paid_by_id, func.count(Order.id))
+                    .filter(*paid_in_range).group_by(Order.paid_by_id).all())
+    items = dict(db.session.query(OrderItem.added_by_id, func.sum(OrderItem.quantity))
+                 .join(Order).filter(*paid_in_range).group_by(OrderItem.added_by_id).all())
+    usernames = dict(db.session.query(User.id, User.username).all())
+
+    rows = {}
+    def row(user_id):
+        if user_id not in rows:
+            rows[user_id] = {'user_id': user_id, 'username': usernames.get(user_id, 'Sin asignar'),
+                             'tickets': 0, 'sales': 0.0, 'average_ticket': 0.0, 'minutes_to_payment': None,
+                             'payments': 0, 'items': 0}
+        return rows[user_id]
+
+    for user_id, tickets, total, avg_seconds in sales:
+        entry = row(user_id)
+        entry['tickets'], entry['sales'] = tickets, total or 0.0
+        entry['average_ticket'] = entry['sales'] / tickets if tickets else 0.0
+        entry['minutes_to_payment'] = avg_seconds / 60 if avg_seconds is not None else None
+    for user_id, count in payments.items():
+        row(user_id)['payments'] = count
+    for user_id, quantity in items.items():
+        row(user_id)['items'] = quantity or 0
+
+    return sorted(rows.values(), key=lambda entry: (-entry['sales'], entry['username']))
+
+@admin_bp.route('/waiters')
+@admin_required
+@reporting_view
+@query_budget(6)
+def waiter_report():
+    today = date.today()
+    try:
+        start = date_arg('start', today - timedelta(days=6))
+        end = date_arg('end', today)
+    except ValueError:
+        flash('Formato de fecha inválido. Mostrando los últimos 7 días.', 'warning')
+        start, end = today - timedelta(days=6), today
+    if end < start:
+        start, end = end, start
+
+    # El día final se incluye completo
+    rows = get_waiter_stats(datetime.combine(start, datetime.min.time()), datetime.combine(end + timedelta(days=1), datetime.min.time()))
+    total_sales = sum(entry['sales'] for entry in rows)
+    total_tickets = sum(entry['tickets'] for entry in rows)
+    return render_template('admin/waiters.html',
+                           rows=rows,
+                           start=start.isoformat(),
+                           end=end.isoformat(),
+                           total_sales=total_sales,
+                           total_tickets=total_tickets,
+                           average_ticket=total_sales / total_tickets if total_tickets else 0.0,
+                           title="Rendimiento por Mozo")
+
+
 @admin_bp.route('/sale/detail/<int:order_id>')
 @admin_required
+@reporting_view
+@query_budget(5)
 def sale_detail_view(order_id):
-    order = Order.query.get_or_404(order_id)
+    order = Order.query.options(joinedload(Order.table_assigned), load_items_with_products()).get_or_404(order_id)
     return_page = request.args.get('page', 1, type=int)
     return_date_filter = request.args.get('date', '')
     
@@ -213,10 +407,14 @@ def annul_sale(order_id):
     if order.status == 'Pagado':
         order.status = 'Venta Anulada'
         order.updated_at = datetime.utcnow()
-        for item in order.items:
-            item.product.stock += item.quantity
-        db.session.commit()
-        flash(f'Venta #{order.id} anulada con éxito. El stock ha sido repuesto.', 'success')
+        inventory.return_sale(order)
+        events.record_order_event(order, events.ORDER_ANNULLED, total=order.total_amount)
+        try:
+            db.session.commit()
+            flash(f'Venta #{order_id} anulada con éxito. El stock ha sido repuesto.', 'success')
+        except StaleDataError:
+            db.session.rollback()
+            flash(f'La venta #{order_id} fue modificada por otro usuario. Revise su estado e intente de nuevo.', 'warning')
     else:
         flash('Solo se pueden anular ventas con estado "Pagado".', 'danger')
 
@@ -356,4 +554,76 @@ def delete_user(user_id):
     db.session.delete(user)
     db.session.commit()
     flash(f'Usuario {user.username} eliminado con éxito.', 'success')
-    return redirect(url_for('admin.manage_users'))
\ No newline at end of file
+    return redirect(url_for('admin.manage_users'))
+
+@admin_bp.route('/jobs')
+@admin_required
+def jobs_view():
+    page = request.args.get('page', 1, type=int)
+    status_filter = request.args.get('status', '').strip()
+
+    query = Job.query
+    if status_filter:
+        query = query.filter(Job.status == status_filter)
+    pagination = query.order_by(Job.id.desc()).paginate(page=page, per_page=ITEMS_PER_PAGE, error_out=False)
+
+    status_counts = dict(db.session.query(Job.status, func.count(Job.id)).group_by(Job.status).all())
+
+    return render_template('admin/jobs.html',
+                           pagination=pagination,
+                           status_filter=status_filter,
+                           status_counts=status_counts,
+                           title="Trabajos en Segundo Plano")
+
+@admin_bp.route('/jobs/<int:job_id>/retry', methods=['POST'])
+@admin_required
+def retry_job(job_id):
+    job = Job.query.get_or_404(job_id)
+    if job.status == JOB_FAILED:
+        job.status = JOB_PENDING
+        job.started_at = None
+        job.finished_at = None
+        job.run_after = None
+        db.session.commit()
+        flash(f'Trabajo #{job.id} reencolado.', 'success')
+    else:
+        flash('Solo se pueden reintentar trabajos fallidos.', 'warning')
+    return redirect(url_for('admin.jobs_view', status=request.form.get('status', '')))
+
+@admin_bp.route('/events')
+@admin_required
+@reporting_view
+def order_events():
+    # Consumo incremental: GET /admin/events?after=<última secuencia procesada>
+    after = request.args.get('after', 0, type=int)
+    limit = min(request.args.get('limit', 500, type=int), 5000)
+    event_types = [t for t in request.args.get('types', '').split(',') if t]
+    batch = events.events_after(after, limit=limit, event_types=event_types or None)
+    return jsonify({
+        'events': [events.event_to_dict(e) for e in batch],
+        'next_after': batch[-1].id if batch else after,
+        'last_sequence': events.last_sequence()
+    })
+
+@admin_bp.route('/profiles')
+@admin_required
+def profiles_view():
+    return render_template('admin/profiles.html',
+                           profiles=profiling.list_profiles(),
+                           sample_rate=current_app.config['PROFILE_SAMPLE_RATE'],
+                           title="Perfiles de Peticiones")
+
+@admin_bp.route('/profiles/<name>')
+@admin_required
+def profile_detail(name):
+    profile = profiling.load_profile(name)
+    if profile is None:
+        abort(404)
+    return render_template('admin/profile_detail.html', profile=profile, title=f"Perfil {profile['endpoint']}")
+
+@admin_bp.route('/profiles/<name>/download')
+@admin_required
+def download_profile(name):
+    if profiling.load_profile(name) is None:
+        abort(404)
+    return send_from_directory(profiling.profiles_dir(), f'{name}.prof', as_attachment=True)
\ No newline at end of file
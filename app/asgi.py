@@ -0,0 +1,202 @@
+# Archivo: app/asgi.py
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from a2wsgi import WSGIMiddleware
+from werkzeug.exceptions import HTTPException
+from . import db, branch_router
+from .streams import ASYNC_STREAMS_KEY, HANDOFF_HEADER, SOURCES, format_message, retry_line
+
+_HANDOFF = HANDOFF_HEADER.lower().encode('latin-1')
+
+
+def _merge_cookies(scope):
+    """Une en una sola las cabeceras Cookie repetidas (HTTP/2 las envía por separado).
+
+    El adaptador WSGI une las cabeceras repetidas con ',', que no separa cookies:
+    la unión correcta para Cookie es '; '.
+    """
+    cookies = [value for name, value in scope['headers'] if name == b'cookie']
+    if len(cookies) < 2:
+        return scope
+    headers = [(name, value) for name, value in scope['headers'] if name != b'cookie']
+    return {**scope, 'headers': headers + [(b'cookie', b'; '.join(cookies))]}
+
+
+class StreamHub:
+    """Un origen de stream por sucursal compartido por todas sus conexiones.
+
+    Consulta la base una vez por intervalo, en un hilo, y deja el último estado en
+    la cola de cada suscriptor; cientos de pantallas cuestan lo mismo que una.
+    """
+
+    def __init__(self, server, name, branch):
+        self.server = server
+        self.name = name
+        self.branch = branch
+        self.source = SOURCES[name](branch)
+        self.latest = None
+        self.subscribers = set()
+        self.task = None
+
+    def subscribe(self, last_id=None):
+        # Cada mensaje es el estado completo: basta una cola de un lugar con el más reciente
+        queue = asyncio.Queue(maxsize=1)
+        if self.latest is not None and str(self.latest.id) != last_id:
+            queue.put_nowait(self.latest)
+        self.subscribers.add(queue)
+        if self.task is None:
+            self.task = asyncio.ensure_future(self.run())
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+
+    def publish(self, message):
+        self.latest = message
+        for queue in self.subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(message)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        interval = self.server.flask_app.config['STREAM_POLL_INTERVAL']
+        try:
+            while self.subscribers:
+                try:
+                    message = await loop.run_in_executor(self.server.poll_executor, self.server.call_in_branch,
+                                                         self.branch, self.source.poll)
+                except Exception:
+                    self.server.flask_app.logger.exception("Falló la consulta del stream '%s' (%s).", self.name, self.branch)
+                    message = None
+                if message is not None:
+                    self.publish(message)
+                await asyncio.sleep(interval)
+        finally:
+            # Sin suscriptores el estado guardado envejece: el próximo arranque vuelve a consultar
+            self.task = None
+            self.latest = None
+            self.source.last_id = None
+
+
+class AsgiServer:
+    """Aplicación ASGI que envuelve la app Flask.
+
+    Las vistas de Flask corren sin cambios con el adaptador WSGI de a2wsgi, en un
+    pool de hilos (ASGI_THREADS) y con la respuesta enviada por partes. Solo las
+    rutas de vistas marcadas con @stream_view pueden entregar la conexión al event
+    loop, donde queda abierta sin ocupar ningún hilo hasta que el cliente se desconecta.
+    """
+
+    def __init__(self, flask_app, threads=None):
+        self.flask_app = flask_app
+        threads = threads or flask_app.config.setdefault('ASGI_THREADS', 16)
+        self.wsgi = WSGIMiddleware(self._wsgi_app, workers=threads)
+        # Aparte, para que las consultas de los streams no esperen detrás de las peticiones
+        self.poll_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='streams')
+        self.urls = flask_app.url_map.bind('localhost')
+        self.hubs = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            scope = _merge_cookies(scope)
+            if self._is_stream(scope):
+                await self._http_stream(scope, receive, send)
+            else:
+                await self.wsgi(scope, receive, send)
+        # Sin websockets: el servidor ASGI rechaza la conexión
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                for hub in self.hubs.values():
+                    if hub.task is not None:
+                        hub.task.cancel()
+                self.poll_executor.shutdown(wait=False)
+                self.wsgi.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _wsgi_app(self, environ, start_response):
+        if environ['asgi.scope'].get(ASYNC_STREAMS_KEY):
+            environ[ASYNC_STREAMS_KEY] = True
+        return self.flask_app(environ, start_response)
+
+    def _is_stream(self, scope):
+        try:
+            endpoint, _ = self.urls.match(scope['path'], method=scope['method'])
+        except HTTPException:
+            return False
+        return getattr(self.flask_app.view_functions.get(endpoint), 'stream', False)
+
+    async def _http_stream(self, scope, receive, send):
+        # La vista corre como cualquier otra (sesión, permisos, sucursal); si entrega el
+        # stream, su respuesta vacía se retiene y la conexión sigue en el event loop.
+        handoff = {}
+
+        async def capture(message):
+            if message['type'] == 'http.response.start':
+                spec = next((value for name, value in message['headers'] if name == _HANDOFF), None)
+                if spec is not None:
+                    handoff['start'], handoff['spec'] = message, json.loads(spec)
+                    return
+            if 'spec' not in handoff:
+                await send(message)
+
+        await self.wsgi({**scope, ASYNC_STREAMS_KEY: True}, receive, capture)
+        if 'spec' in handoff:
+            start = handoff['start']
+            headers = [(name, value) for name, value in start['headers'] if name not in (_HANDOFF, b'content-length')]
+            await send({'type': 'http.response.start', 'status': start['status'], 'headers': headers})
+            await self._stream(handoff['spec'], receive, send)
+
+    def call_in_branch(self, branch, func):
+        with self.flask_app.app_context(), branch_router.use(branch):
+            try:
+                return func()
+            finally:
+                db.session.remove()
+
+    def hub(self, name, branch):
+        key = (name, branch)
+        if key not in self.hubs:
+            self.hubs[key] = StreamHub(self, name, branch)
+        return self.hubs[key]
+
+    async def _stream(self, spec, receive, send):
+        hub = self.hub(spec['stream'], spec['branch'])
+        queue = hub.subscribe(spec.get('last_id'))
+        heartbeat = self.flask_app.config['STREAM_HEARTBEAT']
+        disconnected = asyncio.ensure_future(self._wait_disconnect(receive))
+        try:
+            await send({'type': 'http.response.body', 'body': retry_line(self.flask_app), 'more_body': True})
+            while True:
+                next_message = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait({next_message, disconnected}, timeout=heartbeat,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if disconnected in done:
+                    next_message.cancel()
+                    return
+                if next_message in done:
+                    chunk = format_message(next_message.result())
+                else:
+                    next_message.cancel()
+                    chunk = b': ping\n\n'
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        except OSError:
+            # El cliente se fue mientras se le escribía
+            return
+        finally:
+            hub.unsubscribe(queue)
+            disconnected.cancel()
+
+    @staticmethod
+    async def _wait_disconnect(receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
@@ -0,0 +1,184 @@
+# Archivo: app/assets.py
+import gzip
+import hashlib
+import importlib.util
+import json
+import mimetypes
+import os
+import re
+import shutil
+import subprocess
+import click
+from flask import current_app, send_from_directory, url_for, abort
+from .compression import accepts_encoding
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él solo se generan variantes .gz
+    brotli = None
+
+MANIFEST_NAME = 'manifest.json'
+IMMUTABLE_MAX_AGE = 31536000  # un año
+
+# Hojas de estilo que se publican: nombre lógico -> ruta relativa a la raíz del proyecto,
+# o (paquete de Python, ruta dentro del paquete) para las que se instalan con pip.
+# Las url(...) relativas que contengan (fuentes) se copian y se renombran con su hash.
+CSS_BUNDLES = {
+    'app.css': 'build/app.css',
+    'fontawesome.css': ('fontawesomefree', 'static/fontawesomefree/css/all.min.css'),
+}
+
+CSS_URL_RE = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.ttf', '.json')
+
+
+def _project_root():
+    return os.path.dirname(current_app.root_path)
+
+
+def _dist_dir():
+    return os.path.join(current_app.static_folder, 'dist')
+
+
+def _hashed_name(filename, content):
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    stem, ext = os.path.splitext(filename)
+    return f'{stem}.{digest}{ext}'
+
+
+def _source_path(root_dir, source):
+    if isinstance(source, tuple):
+        package, relative = source
+        spec = importlib.util.find_spec(package)
+        if spec is None:
+            raise click.ClickException(f"Falta el paquete '{package}' (pip install -r requirements.txt).")
+        return os.path.join(os.path.dirname(spec.origin), relative)
+    return os.path.join(root_dir, source)
+
+
+def _write_with_variants(dist_dir, filename, content):
+    with open(os.path.join(dist_dir, filename), 'wb') as f:
+        f.write(content)
+    if not filename.endswith(COMPRESSIBLE_EXTENSIONS):
+        return
+    with open(os.path.join(dist_dir, filename + '.gz'), 'wb') as f:
+        f.write(gzip.compress(content, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(os.path.join(dist_dir, filename + '.br'), 'wb') as f:
+            f.write(brotli.compress(content, quality=11))
+
+
+def _publish_file(dist_dir, source_path, published):
+    """Copia un archivo referenciado desde un CSS (p. ej. una fuente) con nombre fingerprinted."""
+    source_path = os.path.normpath(source_path)
+    if source_path not in published:
+        with open(source_path, 'rb') as f:
+            content = f.read()
+        hashed = _hashed_name(os.path.basename(source_path), content)
+        _write_with_variants(dist_dir, hashed, content)
+        published[source_path] = hashed
+    return published[source_path]
+
+
+def _rewrite_css_urls(css, source_dir, dist_dir, published):
+    def replace(match):
+        quote, ref = match.groups()
+        if ref.startswith(('data:', 'http:', 'https:', '//', '/', '#')):
+            return match.group(0)
+        # Font Awesome usa referencias del tipo "fuente.eot?#iefix": se conserva el sufijo
+        path, sep, suffix = re.match(r'([^?#]*)([?#]?)(.*)', ref).groups()
+        target = os.path.join(source_dir, path)
+        if not os.path.isfile(target):
+            return match.group(0)
+        hashed = _publish_file(dist_dir, target, published)
+        return f'url({quote}{hashed}{sep}{suffix}{quote})'
+    return CSS_URL_RE.sub(replace, css)
+
+
+def build_assets(root_dir, dist_dir):
+    """Genera los CSS fingerprinted con sus variantes comprimidas y escribe el manifiesto."""
+    if os.path.isdir(dist_dir):
+        shutil.rmtree(dist_dir)
+    os.makedirs(dist_dir)
+
+    manifest = {}
+    published = {}
+    for logical_name, sources in CSS_BUNDLES.items():
+        if not isinstance(sources, list):
+            sources = [sources]
+        parts = []
+        for source in sources:
+            source_path = _source_path(root_dir, source)
+            with open(source_path, encoding='utf-8') as f:
+                css = f.read()
+            parts.append(_rewrite_css_urls(css, os.path.dirname(source_path), dist_dir, published))
+        content = '\n'.join(parts).encode('utf-8')
+        hashed = _hashed_name(logical_name, content)
+        _write_with_variants(dist_dir, hashed, content)
+        manifest[logical_name] = hashed
+
+    with open(os.path.join(dist_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(app):
+    path = os.path.join(app.static_folder, 'dist', MANIFEST_NAME)
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def asset_url(logical_name):
+    """Equivalente a url_for('static', ...) para los assets compilados.
+
+    Devuelve None si los assets no se han compilado, para que la plantilla pueda
+    recurrir a los CDN en desarrollo.
+    """
+    hashed = current_app.extensions['asset_manifest'].get(logical_name)
+    if hashed is None:
+        return None
+    return url_for('assets', filename=hashed)
+
+
+def serve_asset(filename):
+    dist_dir = _dist_dir()
+    if filename == MANIFEST_NAME:
+        abort(404)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    encoding = None
+    for candidate, extension in (('br', '.br'), ('gzip', '.gz')):
+        if accepts_encoding(candidate) and os.path.isfile(os.path.join(dist_dir, filename + extension)):
+            encoding = candidate
+            response = send_from_directory(dist_dir, filename + extension, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE)
+            break
+    else:
+        response = send_from_directory(dist_dir, filename, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE)
+
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def init_assets(app):
+    app.extensions['asset_manifest'] = load_manifest(app)
+    app.add_url_rule('/assets/<path:filename>', endpoint='assets', view_func=serve_asset)
+    app.jinja_env.globals['asset_url'] = asset_url
+
+    @app.cli.command('build-assets')
+    @click.option('--skip-css', is_flag=True, help='No recompilar Tailwind; usar build/app.css existente.')
+    def build_assets_command(skip_css):
+        """Compila Tailwind y publica los assets con hash en static/dist."""
+        root_dir = _project_root()
+        if not skip_css:
+            subprocess.run(['npm', 'run', 'build:css'], cwd=root_dir, check=True)
+        manifest = build_assets(root_dir, _dist_dir())
+        app.extensions['asset_manifest'] = manifest
+        for logical_name, hashed in manifest.items():
+            print(f"-> {logical_name}: {hashed}")
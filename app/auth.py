@@ -1,9 +1,9 @@
 # Archivo: app/auth.py
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, session, g
 from werkzeug.security import check_password_hash
 from flask_login import login_user, logout_user, login_required, current_user
 from .models import User
-from . import db
+from . import db, branch_router
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -18,12 +18,19 @@ def login():
         username = request.form.get('username')
         password = request.form.get('password')
         remember = bool(request.form.get('remember'))
+        branch = request.form.get('branch') or branch_router.default
+        if branch not in branch_router.branches:
+            flash('Sucursal inválida.', 'danger')
+            return redirect(url_for('auth.login'))
+        # Los usuarios viven en la base de datos de cada sucursal
+        g.branch = branch
         user = User.query.filter_by(username=username).first()
 
         if not user or not user.check_password(password):
             flash('Nombre de usuario o contraseña inválidos.', 'danger')
             return redirect(url_for('auth.login'))
 
+        session['branch'] = branch
         login_user(user, remember=remember)
         
         if user.role == 'admin':
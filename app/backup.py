@@ -0,0 +1,332 @@
+# Archivo: app/backup.py
+import gzip
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from . import branch_router
+from .cache import cache_versions
+from .jobs import task
+
+# Copias con la API de backup en línea de SQLite: se copian pocas páginas por paso y
+# entre pasos se suelta la base, así los mozos siguen escribiendo durante la copia.
+BACKUP_EVERY = timedelta(hours=6)
+PAGES_PER_STEP = 256
+STEP_PAUSE = 0.005
+# Con escrituras de otras conexiones el backup por pasos vuelve a empezar; pasado este
+# número de reinicios se copia el resto en un solo paso (en WAL no frena a los escritores).
+MAX_RESTARTS = 5
+SNAPSHOT_SUFFIX = '.db.gz'
+
+
+def database_path(branch=None):
+    return branch_router.engine(branch).url.database
+
+
+def backup_dir(app=None):
+    app = app or current_app
+    return app.config['BACKUP_DIR']
+
+
+def snapshot_name(branch, when):
+    return f"bar_app-{branch}-{when.strftime('%Y%m%dT%H%M%S%f')}{SNAPSHOT_SUFFIX}"
+
+
+def list_snapshots(branch=None, directory=None):
+    """Copias de la sucursal (o de todas), de la más reciente a la más antigua."""
+    directory = directory or backup_dir()
+    if not os.path.isdir(directory):
+        return []
+    prefix = f'bar_app-{branch}-' if branch else 'bar_app-'
+    names = [name for name in os.listdir(directory) if name.startswith(prefix) and name.endswith(SNAPSHOT_SUFFIX)]
+    return sorted(names, reverse=True)
+
+
+def schema_revision(path):
+    """Revisión de Alembic guardada en la base (None si no tiene migraciones)."""
+    connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        return connection.execute('SELECT version_num FROM alembic_version').fetchone()[0]
+    except (sqlite3.DatabaseError, TypeError):
+        return None
+    finally:
+        connection.close()
+
+
+def integrity_check(path):
+    """Devuelve la lista de problemas que informa PRAGMA integrity_check (vacía si la base está sana)."""
+    connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        rows = [row[0] for row in connection.execute('PRAGMA integrity_check')]
+    except sqlite3.DatabaseError as e:
+        # Archivo que ni siquiera se puede abrir como base SQLite
+        return [str(e)]
+    finally:
+        connection.close()
+    return [] if rows == ['ok'] else rows
+
+
+class WriteProbe:
+    """Mide cuánto tarda un escritor en obtener el bloqueo de escritura.
+
+    Abre transacciones BEGIN IMMEDIATE vacías (sin modificar datos) cada `interval`
+    segundos desde su propia conexión, como lo haría una petición de un mozo.
+    """
+
+    def __init__(self, path, interval=0.02):
+        self.path = path
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self, connection):
+        started = time.perf_counter()
+        connection.execute('BEGIN IMMEDIATE')
+        self.samples.append((time.perf_counter() - started) * 1000)
+        connection.execute('ROLLBACK')
+
+    def _run(self):
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            while not self._stop.is_set():
+                self.sample(connection)
+                self._stop.wait(self.interval)
+        finally:
+            connection.close()
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, name='backup-write-probe', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def summary(self):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return {'samples': len(ordered), 'p50_ms': round(statistics.median(ordered), 3),
+                'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+                'max_ms': round(ordered[-1], 3)}
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+def _copy_online(source_path, target_path, pages, pause):
+    """Copia la base con la API de backup en pasos de `pages` páginas."""
+    stats = {'steps': 0, 'restarts': 0, 'pages': 0, 'single_step': False}
+    last_remaining = None
+
+    def progress(status, remaining, total):
+        nonlocal last_remaining
+        stats['steps'] += 1
+        stats['pages'] = total
+        # Si lo que falta crece, otra conexión escribió y SQLite reinició la copia
+        if last_remaining is not None and remaining > last_remaining:
+            stats['restarts'] += 1
+            if stats['restarts'] > MAX_RESTARTS:
+                raise _TooManyRestarts()
+        last_remaining = remaining
+        if pause and remaining:
+            time.sleep(pause)
+
+    source = sqlite3.connect(f'file:{source_path}?mode=ro', uri=True, timeout=30)
+    target = sqlite3.connect(target_path)
+    try:
+        try:
+            source.backup(target, pages=pages, progress=progress)
+        except _TooManyRestarts:
+            stats['single_step'] = True
+            source.backup(target)
+    finally:
+        target.close()
+        source.close()
+    return stats
+
+
+def _compress(path, target_path):
+    # Escritura atómica: una copia a medias nunca queda con el nombre definitivo
+    with open(path, 'rb') as source, gzip.open(target_path + '.tmp', 'wb', compresslevel=6) as target:
+        shutil.copyfileobj(source, target, 1024 * 1024)
+    os.replace(target_path + '.tmp', target_path)
+
+
+def rotate(branch, keep, directory=None):
+    directory = directory or backup_dir()
+    removed = list_snapshots(branch, directory)[keep:]
+    for name in removed:
+        os.remove(os.path.join(directory, name))
+    return removed
+
+
+def create_snapshot(branch=None, keep=None, pages=PAGES_PER_STEP, pause=STEP_PAUSE, probe=False):
+    """Copia en línea la base de la sucursal, la verifica, la comprime y rota las copias viejas.
+
+    Devuelve un resumen con duración, tamaños y (con probe=True) la latencia para
+    obtener el bloqueo de escritura antes y durante la copia.
+    """
+    branch = branch or branch_router.current()
+    keep = keep if keep is not None else current_app.config['BACKUP_KEEP']
+    source_path = database_path(branch)
+    directory = backup_dir()
+    os.makedirs(directory, exist_ok=True)
+
+    started_at = datetime.utcnow()
+    name = snapshot_name(branch, started_at)
+    baseline = None
+    if probe:
+        baseline = WriteProbe(source_path)
+        connection = sqlite3.connect(source_path, timeout=30, isolation_level=None)
+        try:
+            for _ in range(20):
+                baseline.sample(connection)
+        finally:
+            connection.close()
+
+    with tempfile.TemporaryDirectory(dir=directory, prefix='.backup-') as work_dir:
+        raw_path = os.path.join(work_dir, 'snapshot.db')
+        started = time.perf_counter()
+        if probe:
+            with WriteProbe(source_path) as during:
+                stats = _copy_online(source_path, raw_path, pages, pause)
+        else:
+            during = None
+            stats = _copy_online(source_path, raw_path, pages, pause)
+        copy_seconds = time.perf_counter() - started
+
+        problems = integrity_check(raw_path)
+        if problems:
+            raise RuntimeError(f"La copia de '{branch}' no pasó integrity_check: {problems[:5]}")
+
+        target_path = os.path.join(directory, name)
+        _compress(raw_path, target_path)
+        raw_size = os.path.getsize(raw_path)
+
+    result = {
+        'branch': branch,
+        'file': name,
+        'copy_seconds': round(copy_seconds, 3),
+        'total_seconds': round(time.perf_counter() - started, 3),
+        'pages': stats['pages'],
+        'steps': stats['steps'],
+        'restarts': stats['restarts'],
+        'single_step': stats['single_step'],
+        'size_bytes': raw_size,
+        'compressed_bytes': os.path.getsize(target_path),
+        'rotated': rotate(branch, keep, directory),
+    }
+    if probe:
+        result['write_lock_baseline'] = baseline.summary()
+        result['write_lock_during_backup'] = during.summary()
+    return result
+
+
+def restore_snapshot(snapshot_path, branch=None):
+    """Verifica una copia y la vuelca sobre la base de la sucursal con la API de backup.
+
+    Antes de tocar la base guarda una copia de seguridad del estado actual.
+    """
+    branch = branch or branch_router.current()
+    target_path = database_path(branch)
+    with tempfile.TemporaryDirectory(dir=backup_dir(), prefix='.restore-') as work_dir:
+        raw_path = os.path.join(work_dir, 'restore.db')
+        opener = gzip.open if snapshot_path.endswith('.gz') else open
+        with opener(snapshot_path, 'rb') as source, open(raw_path, 'wb') as target:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+
+        problems = integrity_check(raw_path)
+        if problems:
+            raise click.ClickException(f"La copia no pasó integrity_check: {problems[:5]}")
+
+        revision = schema_revision(raw_path)
+        safety = create_snapshot(branch, keep=len(list_snapshots(branch)) + 1)
+        source = sqlite3.connect(f'file:{raw_path}?mode=ro', uri=True)
+        target = sqlite3.connect(target_path, timeout=30)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+
+    problems = integrity_check(target_path)
+    if problems:
+        raise click.ClickException(f"La base restaurada no pasó integrity_check: {problems[:5]}; copia previa: {safety['file']}")
+    # Las cachés en memoria de los workers reflejan la base anterior
+    cache_versions.invalidate_all(branch)
+    return {'branch': branch, 'restored_from': os.path.basename(snapshot_path), 'safety_snapshot': safety['file'],
+            'revision': revision}
+
+
+@task('backup_database', every=BACKUP_EVERY)
+def backup_database():
+    return create_snapshot()
+
+
+def _print_result(result):
+    print(f"  Copia: {result['file']} ({result['size_bytes'] / 1024:.0f} KB -> {result['compressed_bytes'] / 1024:.0f} KB comprimida)")
+    print(f"  Duración: {result['copy_seconds']:.3f} s de copia, {result['total_seconds']:.3f} s en total "
+          f"({result['pages']} páginas en {result['steps']} pasos, {result['restarts']} reinicios"
+          f"{', resto en un solo paso' if result['single_step'] else ''})")
+    if result.get('write_lock_during_backup'):
+        baseline, during = result['write_lock_baseline'], result['write_lock_during_backup']
+        print(f"  Espera de escritura sin copia: p50 {baseline['p50_ms']} ms, máx {baseline['max_ms']} ms")
+        print(f"  Espera de escritura durante la copia: p50 {during['p50_ms']} ms, p95 {during['p95_ms']} ms, "
+              f"máx {during['max_ms']} ms ({during['samples']} muestras)")
+    if result['rotated']:
+        print(f"  Rotadas: {', '.join(result['rotated'])}")
+
+
+def init_backup(app):
+    app.config.setdefault('BACKUP_DIR', os.environ.get('BACKUP_DIR', os.path.join(app.instance_path, 'backups')))
+    app.config.setdefault('BACKUP_KEEP', int(os.environ.get('BACKUP_KEEP', '28')))
+
+    @app.cli.command('backup')
+    @click.option('--branch', 'branches', multiple=True, help='Sucursal a copiar (por defecto, todas).')
+    @click.option('--keep', type=int, default=None, help='Copias a conservar por sucursal (BACKUP_KEEP).')
+    @click.option('--pages', default=PAGES_PER_STEP, show_default=True, help='Páginas copiadas por paso.')
+    @click.option('--probe', is_flag=True, help='Medir la espera para escribir durante la copia.')
+    @click.option('--list', 'list_only', is_flag=True, help='Listar las copias existentes y salir.')
+    def backup_command(branches, keep, pages, probe, list_only):
+        """Copia en línea, verificada y comprimida, de la base de cada sucursal."""
+        for code in branches or app.config['BRANCHES']:
+            with branch_router.use(code):
+                if list_only:
+                    print(f"-> {code}:")
+                    for name in list_snapshots(code):
+                        print(f"  {name}")
+                    continue
+                print(f"-> Copiando sucursal '{code}'...")
+                _print_result(create_snapshot(code, keep=keep, pages=pages, probe=probe))
+
+    @app.cli.command('restore')
+    @click.argument('snapshot')
+    @click.option('--branch', default=None, help='Sucursal a restaurar (por defecto, la activa).')
+    @click.option('--yes', is_flag=True, help='No pedir confirmación.')
+    def restore_command(snapshot, branch, yes):
+        """Restaura una copia (ruta o nombre dentro de BACKUP_DIR) tras verificar su integridad.
+
+        Conviene detener la aplicación y los workers antes de restaurar.
+        """
+        path = snapshot if os.path.exists(snapshot) else os.path.join(backup_dir(app), snapshot)
+        if not os.path.exists(path):
+            raise click.ClickException(f"No existe la copia {snapshot}.")
+        branch = branch or app.config['ACTIVE_BRANCH']
+        if not yes:
+            click.confirm(f"Se reemplazará la base de la sucursal '{branch}' con {os.path.basename(path)}. ¿Continuar?", abort=True)
+        with branch_router.use(branch):
+            current_revision = schema_revision(database_path(branch))
+            result = restore_snapshot(path, branch)
+        print(f"Sucursal '{branch}' restaurada desde {result['restored_from']}. Copia previa: {result['safety_snapshot']}")
+        if result['revision'] != current_revision:
+            print(f"  La copia tiene el esquema {result['revision']} (antes: {current_revision}); ejecute 'flask upgrade-branches'.")
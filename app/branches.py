@@ -0,0 +1,164 @@
+# Archivo: app/branches.py
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from flask import current_app, g, has_app_context, session
+from flask_sqlalchemy.session import Session
+
+# Formato de BAR_BRANCHES: "codigo:Nombre,codigo:Nombre". La primera sucursal es la
+# principal y usa la base de datos histórica (bar_app.db); el resto usa bar_app_<codigo>.db.
+DEFAULT_BRANCHES = 'principal:Principal'
+
+
+def parse_branches(spec):
+    branches = OrderedDict()
+    for entry in spec.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        code, _, name = entry.partition(':')
+        code = code.strip().lower()
+        branches[code] = name.strip() or code.capitalize()
+    if not branches:
+        raise ValueError("BAR_BRANCHES no define ninguna sucursal.")
+    return branches
+
+
+def bind_key(code):
+    return f'branch:{code}'
+
+
+def user_session_id(code, user_id):
+    """Id de usuario guardado en la sesión y en la cookie "recordarme".
+
+    Los ids se repiten entre sucursales (cada una tiene su tabla de usuarios),
+    así que el id lleva la sucursal: "norte:1".
+    """
+    return f'{code}:{user_id}'
+
+
+def parse_user_session_id(value):
+    """Devuelve (sucursal, id); la sucursal es None en ids anteriores sin sucursal."""
+    code, _, user_id = value.rpartition(':')
+    return code or None, user_id
+
+
+def report_key(code):
+    """Bind de solo lectura usado por las vistas de reportes (ver reporting.py)."""
+    return f'report:{code}'
+
+
+class BranchSession(Session):
+    """Sesión que envía cada consulta a la base de datos de la sucursal activa."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context():
+            router = current_app.extensions.get('branches')
+            if router is not None:
+                return router.engine(readonly=g.get('reporting', False))
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class BranchRouter:
+    """Elige la base de datos (shard) de la sucursal en cada petición.
+
+    Cada sucursal tiene su propio archivo SQLite, de modo que el bloqueo de
+    escritura de una sucursal con mucho movimiento no frena a las demás.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        branches = parse_branches(os.environ.get('BAR_BRANCHES', DEFAULT_BRANCHES))
+        default = next(iter(branches))
+        app.config['BRANCHES'] = branches
+        app.config['DEFAULT_BRANCH'] = default
+        # Sucursal usada fuera de una petición (comandos CLI, worker): BAR_BRANCH=norte flask seed-db
+        app.config['ACTIVE_BRANCH'] = os.environ.get('BAR_BRANCH', default)
+        if app.config['ACTIVE_BRANCH'] not in branches:
+            raise ValueError(f"BAR_BRANCH '{app.config['ACTIVE_BRANCH']}' no está en BAR_BRANCHES.")
+
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        for code in list(branches)[1:]:
+            binds[bind_key(code)] = f'sqlite:///{os.path.join(app.instance_path, f"bar_app_{code}.db")}'
+        app.config['SQLALCHEMY_BINDS'] = binds
+
+        app.extensions['branches'] = self
+
+        @app.before_request
+        def select_branch():
+            code = session.get('branch')
+            g.branch = code if code in branches else default
+
+        @app.context_processor
+        def branch_processor():
+            return dict(branches=branches, current_branch=self.current())
+
+        @app.cli.command('upgrade-branches')
+        def upgrade_branches_command():
+            """Aplica las migraciones pendientes a la base de datos de cada sucursal."""
+            from flask_migrate import upgrade
+            for code in branches:
+                print(f"-> Migrando sucursal '{code}'...")
+                with self.use(code):
+                    upgrade()
+
+    @property
+    def branches(self):
+        return current_app.config['BRANCHES']
+
+    @property
+    def default(self):
+        return current_app.config['DEFAULT_BRANCH']
+
+    def current(self):
+        return g.get('branch') or current_app.config['ACTIVE_BRANCH']
+
+    def is_multi_branch(self):
+        return len(self.branches) > 1
+
+    def engine(self, code=None, readonly=False):
+        """Motor de la sucursal; con readonly=True, el de reportes si está configurado."""
+        code = code or self.current()
+        engines = current_app.extensions['sqlalchemy'].engines
+        if readonly and report_key(code) in engines:
+            return engines[report_key(code)]
+        return engines[None] if code == self.default else engines[bind_key(code)]
+
+    @contextmanager
+    def use(self, code):
+        """Cambia temporalmente la sucursal activa dentro del contexto de aplicación actual."""
+        if code not in self.branches:
+            raise KeyError(f"Sucursal desconocida: {code}")
+        previous = g.get('branch')
+        g.branch = code
+        try:
+            yield
+        finally:
+            g.branch = previous
+
+    def run_parallel(self, func, codes=None):
+        """Ejecuta func() en cada sucursal en paralelo y devuelve {codigo: resultado}.
+
+        Cada hilo abre su propio contexto de aplicación, así que también tiene su
+        propia sesión de base de datos ligada al shard de esa sucursal.
+        """
+        app = current_app._get_current_object()
+        codes = list(codes or self.branches)
+        reporting = g.get('reporting', False)
+
+        def run(code):
+            with app.app_context():
+                g.branch = code
+                g.reporting = reporting
+                return code, func()
+
+        with ThreadPoolExecutor(max_workers=len(codes), thread_name_prefix='branch') as executor:
+            return OrderedDict(executor.map(run, codes))
+
+
+def current_branch():
+    return current_app.extensions['branches'].current()
@@ -0,0 +1,347 @@
+# Archivo: app/cache.py
+import os
+import sqlite3
+import threading
+import time
+import click
+from flask import g, has_app_context, has_request_context
+from sqlalchemy import event, inspect, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, make_transient_to_detached
+from . import db, branch_router
+
+try:
+    import redis
+except ImportError:  # redis es opcional: solo hace falta con CACHE_COHERENCE=redis://...
+    redis = None
+
+_BUMP = text(
+    "INSERT INTO cache_version (name, version) VALUES (:name, 1) "
+    "ON CONFLICT(name) DO UPDATE SET version = version + 1"
+)
+# Tras restaurar una copia, las versiones de la copia pueden ser menores que las que ya
+# vieron los workers: se llevan por encima de cualquier valor anterior (microsegundos).
+_RESET = text(
+    "INSERT INTO cache_version (name, version) VALUES (:name, :stamp) "
+    "ON CONFLICT(name) DO UPDATE SET version = MAX(version + 1, excluded.version)"
+)
+
+
+class SQLiteVersions:
+    """Versiones guardadas en la tabla cache_version de cada sucursal.
+
+    El incremento se escribe en la misma transacción que el cambio, así que
+    ningún worker ve datos nuevos con la versión vieja. Cada hilo lee con su
+    propia conexión y solo vuelve a consultar la tabla cuando PRAGMA
+    data_version indica que otra conexión confirmó algo en el archivo.
+    """
+
+    transactional = True
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def reset(self):
+        # Las conexiones abiertas antes de un fork no se deben usar en el proceso hijo
+        self._local = threading.local()
+
+    def _state(self, branch):
+        states = getattr(self._local, 'states', None)
+        if states is None:
+            states = self._local.states = {}
+        state = states.get(branch)
+        if state is None:
+            path = branch_router.engine(branch).url.database
+            connection = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+            state = states[branch] = {'connection': connection, 'data_version': None, 'versions': {}}
+        return state
+
+    def read(self, branch):
+        state = self._state(branch)
+        connection = state['connection']
+        data_version = connection.execute('PRAGMA data_version').fetchone()[0]
+        if data_version != state['data_version']:
+            state['versions'] = dict(connection.execute('SELECT name, version FROM cache_version'))
+            state['data_version'] = data_version
+        return state['versions']
+
+    def bump(self, connection, names):
+        connection.execute(_BUMP, [{'name': name} for name in sorted(names)])
+
+    def committed(self, branch, names):
+        pass
+
+    def invalidate_all(self, branch, names):
+        stamp = time.time_ns() // 1000
+        try:
+            with branch_router.engine(branch).begin() as connection:
+                connection.execute(_RESET, [{'name': name, 'stamp': stamp} for name in sorted(names)])
+        except OperationalError:
+            # Copia anterior a la tabla cache_version: se crea vacía al aplicar las migraciones
+            pass
+
+
+class MemoryVersions:
+    """Versiones dentro del proceso. Solo sirve con un único worker (desarrollo)."""
+
+    transactional = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions = {}
+
+    def reset(self):
+        pass
+
+    def read(self, branch):
+        return dict(self._versions.get(branch, {}))
+
+    def committed(self, branch, names):
+        with self._lock:
+            versions = self._versions.setdefault(branch, {})
+            for name in names:
+                versions[name] = versions.get(name, 0) + 1
+
+    def invalidate_all(self, branch, names):
+        self.committed(branch, names)
+
+
+class RedisVersions:
+    """Versiones en un hash de Redis (o un servidor compatible) por sucursal.
+
+    Redis no participa de la transacción de SQLite: el incremento se hace después
+    del commit. Entre el commit y el incremento otro worker puede servir la versión
+    anterior durante unos milisegundos.
+    """
+
+    transactional = False
+
+    def __init__(self, url, prefix='bar:cache_version'):
+        if redis is None:
+            raise RuntimeError("CACHE_COHERENCE usa Redis pero el paquete 'redis' no está instalado.")
+        self._client = redis.Redis.from_url(url)
+        self._prefix = prefix
+
+    def reset(self):
+        pass
+
+    def _key(self, branch):
+        return f'{self._prefix}:{branch}'
+
+    def read(self, branch):
+        return {name.decode(): int(version) for name, version in self._client.hgetall(self._key(branch)).items()}
+
+    def committed(self, branch, names):
+        pipeline = self._client.pipeline(transaction=False)
+        for name in names:
+            pipeline.hincrby(self._key(branch), name, 1)
+        pipeline.execute()
+
+    def invalidate_all(self, branch, names):
+        self.committed(branch, names)
+
+
+def make_backend(spec):
+    """Backend según CACHE_COHERENCE: 'sqlite' (por defecto), 'memory' o una URL redis://."""
+    if spec == 'sqlite':
+        return SQLiteVersions()
+    if spec == 'memory':
+        return MemoryVersions()
+    if spec.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisVersions(spec)
+    raise ValueError(f"CACHE_COHERENCE desconocido: {spec}")
+
+
+class CacheVersions:
+    """Versión de cada caché en memoria, compartida entre los workers.
+
+    Una caché guarda cada entrada junto con la versión con la que se generó y
+    la descarta cuando la versión cambia. Las versiones se consultan una sola vez
+    por petición y sucursal; el resto de las lecturas de la petición son en memoria.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or SQLiteVersions()
+        self.names = set()
+
+    def register(self, name):
+        self.names.add(name)
+        return name
+
+    def current(self, branch=None):
+        branch = branch or branch_router.current()
+        if not has_request_context():
+            return self.backend.read(branch)
+        checked = g.setdefault('cache_versions', {})
+        if branch not in checked:
+            checked[branch] = self.backend.read(branch)
+        return checked[branch]
+
+    def get(self, name, branch=None):
+        return self.current(branch).get(name, 0)
+
+    def forget(self, branch):
+        # Después de un commit propio la petición tiene que ver la versión nueva
+        if has_app_context():
+            g.get('cache_versions', {}).pop(branch, None)
+
+    def invalidate_all(self, branch=None):
+        branch = branch or branch_router.current()
+        self.backend.invalidate_all(branch, self.names)
+        self.forget(branch)
+
+
+cache_versions = CacheVersions()
+CATALOGUE = cache_versions.register('catalogue')
+USERS = cache_versions.register('users')
+# Estado de las mesas (estado y total del pedido activo) que siguen las pantallas del salón
+FLOOR = cache_versions.register('floor')
+
+
+class FragmentCache:
+    """Caché en memoria de fragmentos HTML ya renderizados.
+
+    Cada entrada se guarda junto con la versión de la caché con la que fue
+    generada; si la versión cambió, el fragmento se vuelve a renderizar.
+    """
+
+    def __init__(self, name):
+        self.name = cache_versions.register(name)
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get_or_render(self, key, render_fn):
+        version = cache_versions.get(self.name)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        html = render_fn()
+        with self._lock:
+            self._entries[key] = (version, html)
+        return html
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class UserCache:
+    """Usuarios por id para el user_loader de Flask-Login, sin una consulta por petición."""
+
+    def __init__(self, name):
+        self.name = cache_versions.register(name)
+        self._entries = {}
+
+    def get(self, user_id):
+        from .models import User
+        branch = branch_router.current()
+        version = cache_versions.get(self.name, branch)
+        entry = self._entries.get((branch, user_id))
+        if entry is None or entry[0] != version:
+            user = db.session.get(User, user_id)
+            if user is None:
+                return None
+            values = {attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs}
+            self._entries[(branch, user_id)] = (version, values)
+            return user
+        # Se arma una instancia nueva a partir de las columnas y se adjunta a la sesión sin consultar
+        user = User(**entry[1])
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+fragment_cache = FragmentCache(CATALOGUE)
+user_cache = UserCache(USERS)
+
+
+def mark_dirty(session, name, branch=None):
+    """Invalida la caché `name` de la sucursal cuando se confirme la transacción de `session`."""
+    session.info.setdefault('cache_dirty', set()).add((branch or branch_router.current(), name))
+
+
+def mark_catalogue_dirty(session):
+    """Las escrituras hechas con Core no pasan por before_flush: se marcan a mano."""
+    mark_dirty(session, CATALOGUE)
+
+
+def _touches(session, classes):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, classes):
+            return True
+    return False
+
+
+def _write_bumps(session):
+    """Escribe en la transacción en curso los incrementos marcados que falten."""
+    if not cache_versions.backend.transactional:
+        return
+    bumped = session.info.setdefault('cache_bumped', set())
+    pending = session.info.get('cache_dirty', set()) - bumped
+    if not pending:
+        return
+    for branch in {branch for branch, _ in pending}:
+        connection = session.connection(bind_arguments={'bind': branch_router.engine(branch)})
+        cache_versions.backend.bump(connection, {name for code, name in pending if code == branch})
+    bumped |= pending
+
+
+@event.listens_for(Session, 'before_flush')
+def _mark_caches_dirty(session, flush_context, instances):
+    from .models import Order, Product, StockMovement, Table, User
+    # Un movimiento de stock cambia el disponible aunque la fila del producto no cambie
+    if _touches(session, (Product, StockMovement)):
+        mark_dirty(session, CATALOGUE)
+    if _touches(session, User):
+        mark_dirty(session, USERS)
+    if _touches(session, (Table, Order)):
+        mark_dirty(session, FLOOR)
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_after_flush(session, flush_context):
+    _write_bumps(session)
+
+
+@event.listens_for(Session, 'before_commit')
+def _bump_before_commit(session):
+    # Marcas de escrituras Core que no pasan por un flush
+    _write_bumps(session)
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_cache_versions(session):
+    session.info.pop('cache_bumped', None)
+    dirty = session.info.pop('cache_dirty', set())
+    for branch in {branch for branch, _ in dirty}:
+        cache_versions.backend.committed(branch, {name for code, name in dirty if code == branch})
+        cache_versions.forget(branch)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_cache_marks(session):
+    session.info.pop('cache_dirty', None)
+    session.info.pop('cache_bumped', None)
+
+
+def init_cache(app):
+    app.config.setdefault('CACHE_COHERENCE', os.environ.get('CACHE_COHERENCE', 'sqlite'))
+    cache_versions.backend = make_backend(app.config['CACHE_COHERENCE'])
+
+    @app.cli.command('cache-versions')
+    def cache_versions_command():
+        """Muestra la versión de cada caché en memoria por sucursal."""
+        print(f"Backend: {app.config['CACHE_COHERENCE']}")
+        for code in branch_router.branches:
+            versions = cache_versions.backend.read(code)
+            print(f"-> {code}: " + ', '.join(f"{name}={versions.get(name, 0)}" for name in sorted(cache_versions.names)))
+
+    @app.cli.command('cache-invalidate')
+    @click.option('--branch', 'branches', multiple=True, help="Sucursal (por defecto, todas).")
+    def cache_invalidate_command(branches):
+        """Invalida todas las cachés en memoria de los workers."""
+        for code in branches or branch_router.branches:
+            cache_versions.invalidate_all(code)
+            print(f"-> Cachés de '{code}' invalidadas.")
@@ -0,0 +1,79 @@
+# Archivo: app/compression.py
+import gzip
+import os
+from flask import request
+
+# Solo se comprime texto; imágenes y fuentes ya vienen comprimidas
+COMPRESSIBLE_MIMETYPES = {'text/html', 'text/plain', 'text/css', 'application/json', 'application/javascript'}
+
+
+def _quality(params):
+    for param in params.split(';'):
+        name, _, value = param.strip().partition('=')
+        if name.strip().lower() == 'q':
+            try:
+                return float(value)
+            except ValueError:
+                return 0.0
+    return 1.0
+
+
+def accepts_encoding(coding):
+    """Indica si el Accept-Encoding de la petición admite `coding` ('gzip', 'br').
+
+    Un q=0 lo rechaza, y una mención explícita de la codificación pesa más que '*'.
+    """
+    wildcard = False
+    for part in request.headers.get('Accept-Encoding', '').split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if name == coding:
+            return _quality(params) > 0
+        if name == '*':
+            wildcard = _quality(params) > 0
+    return wildcard
+
+
+def compress_response(response, min_size, level):
+    """Comprime con gzip una respuesta dinámica si el cliente lo acepta.
+
+    Quedan fuera las respuestas en streaming o servidas desde archivo
+    (direct_passthrough, p. ej. /assets, que ya tiene sus variantes .gz/.br)
+    y las que ya traen Content-Encoding.
+    """
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 206, 304)
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or 'no-transform' in response.headers.get('Cache-Control', '')):
+        return response
+
+    # La representación depende del Accept-Encoding aunque esta vez no se comprima
+    response.vary.add('Accept-Encoding')
+    if not accepts_encoding('gzip'):
+        return response
+    data = response.get_data()
+    if len(data) < min_size:
+        return response
+
+    response.set_data(gzip.compress(data, compresslevel=level, mtime=0))
+    response.headers['Content-Encoding'] = 'gzip'
+    # Los bytes ya no son los mismos que los del ETag fuerte calculado sobre el cuerpo original
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_compression(app):
+    app.config.setdefault('COMPRESS_RESPONSES', os.environ.get('COMPRESS_RESPONSES', '1') != '0')
+    app.config.setdefault('COMPRESS_MIN_SIZE', int(os.environ.get('COMPRESS_MIN_SIZE', '500')))
+    app.config.setdefault('COMPRESS_LEVEL', int(os.environ.get('COMPRESS_LEVEL', '6')))
+
+    # Registrado antes que el resto de los after_request, corre último y comprime
+    # la respuesta ya terminada (con sus cabeceras de perfilado y de presupuesto SQL).
+    @app.after_request
+    def gzip_response(response):
+        if not app.config['COMPRESS_RESPONSES']:
+            return response
+        return compress_response(response, app.config['COMPRESS_MIN_SIZE'], app.config['COMPRESS_LEVEL'])
@@ -0,0 +1,83 @@
+# Archivo: app/events.py
+import json
+from . import db
+from .models import OrderEvent, EventCursor
+
+# Tipos de evento registrados por las rutas de mozo y admin
+ORDER_CREATED = 'created'
+ORDER_UPDATED = 'updated'
+ITEM_ADDED = 'item_added'
+ITEM_REMOVED = 'item_removed'
+ORDER_READY = 'ready'
+ORDER_PAID = 'paid'
+ORDER_CANCELLED = 'cancelled'
+ORDER_ANNULLED = 'annulled'
+ORDER_DELETED = 'deleted'
+
+
+def record_order_event(order, event_type, **payload):
+    """Agrega un evento a la sesión actual; se confirma en la misma transacción que el cambio."""
+    payload.setdefault('status', order.status)
+    event = OrderEvent(order=order, event_type=event_type, payload=json.dumps(payload))
+    db.session.add(event)
+    return event
+
+
+def event_values(order_id, event_type, status, **payload):
+    """Columnas de un evento para insertarlo con Core, sin pasar por la sesión del ORM."""
+    payload.setdefault('status', status)
+    return {'order_id': order_id, 'event_type': event_type, 'payload': json.dumps(payload)}
+
+
+def event_to_dict(event):
+    return {
+        'sequence': event.id,
+        'order_id': event.order_id,
+        'type': event.event_type,
+        'payload': json.loads(event.payload or '{}'),
+        'created_at': event.created_at.isoformat() if event.created_at else None,
+    }
+
+
+def events_after(sequence, limit=500, event_types=None):
+    """Eventos con número de secuencia mayor a `sequence`, en orden.
+
+    En SQLite las escrituras se serializan, así que la secuencia se confirma en
+    orden y leer "después de N" nunca saltea eventos.
+    """
+    query = OrderEvent.query.filter(OrderEvent.id > sequence)
+    if event_types:
+        query = query.filter(OrderEvent.event_type.in_(event_types))
+    return query.order_by(OrderEvent.id).limit(limit).all()
+
+
+def last_sequence():
+    return db.session.query(db.func.max(OrderEvent.id)).scalar() or 0
+
+
+def consume(name, handler, limit=500, event_types=None):
+    """Procesa los eventos nuevos para el consumidor `name` y avanza su cursor.
+
+    `handler(events)` recibe la lista de eventos; si lanza una excepción, el cursor
+    no avanza y el lote se volverá a entregar. Devuelve la cantidad procesada.
+    """
+    cursor = db.session.get(EventCursor, name)
+    if cursor is None:
+        cursor = EventCursor(name=name, last_sequence=0)
+        db.session.add(cursor)
+
+    events = OrderEvent.query.filter(OrderEvent.id > cursor.last_sequence).order_by(OrderEvent.id).limit(limit).all()
+    if not events:
+        db.session.commit()
+        return 0
+
+    relevant = [e for e in events if not event_types or e.event_type in event_types]
+    try:
+        if relevant:
+            handler(relevant)
+        cursor.last_sequence = events[-1].id
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return len(relevant)
@@ -0,0 +1,171 @@
+# Archivo: app/inventory.py
+import os
+from collections import namedtuple
+from datetime import timedelta
+from flask import has_request_context
+from flask_login import current_user
+from sqlalchemy import update
+from . import db
+from .models import Product, StockMovement, EventCursor
+from .jobs import task
+
+# Motivos de los movimientos de stock
+RESERVATION = 'reservation'    # ítem agregado a un pedido abierto
+RELEASE = 'release'            # ítem quitado de un pedido abierto
+CANCELLATION = 'cancellation'  # pedido abierto cancelado: se liberan sus reservas
+SALE = 'sale'                  # pedido cobrado: la reserva pasa a salida de existencias
+RETURN = 'return'              # venta anulada: las existencias vuelven
+ADJUSTMENT = 'adjustment'      # corrección manual (conteo, rotura, edición del producto)
+IMPORT = 'import'              # ingreso de mercadería
+
+KIND_LABELS = {
+    RESERVATION: 'Reserva', RELEASE: 'Liberación', CANCELLATION: 'Cancelación', SALE: 'Venta',
+    RETURN: 'Devolución', ADJUSTMENT: 'Ajuste', IMPORT: 'Ingreso',
+}
+
+# Cursor (en event_cursor) hasta el que el libro ya está volcado en Product.stock / Product.reserved
+LEDGER_CURSOR = 'stock_ledger'
+COMPACT_EVERY = timedelta(minutes=5)
+# Disponible a partir del cual un producto aparece en el reporte de stock bajo
+DEFAULT_LOW_STOCK_THRESHOLD = 10
+
+StockLevel = namedtuple('StockLevel', ['on_hand', 'reserved', 'available'])
+
+
+def movement_values(product_id, kind, on_hand_delta=0, reserved_delta=0, order_id=None, note=None):
+    """Columnas de un movimiento; también sirve para insertarlo con Core (insert(StockMovement.__table__))."""
+    values = {'product_id': product_id, 'kind': kind, 'on_hand_delta': on_hand_delta,
+              'reserved_delta': reserved_delta, 'order_id': order_id, 'note': note}
+    if has_request_context() and current_user.is_authenticated:
+        values['user_id'] = current_user.id
+    return values
+
+
+def _record(product_id, kind, on_hand_delta=0, reserved_delta=0, order_id=None, note=None):
+    movement = StockMovement(**movement_values(product_id, kind, on_hand_delta, reserved_delta, order_id, note))
+    db.session.add(movement)
+    return movement
+
+
+# Los cambios de stock se agregan al libro en lugar de actualizar la fila del producto,
+# así los pedidos simultáneos de un mismo producto no compiten por esa fila.
+# Igual que events.record_order_event, no confirman: van en la transacción del pedido.
+
+def reserve(order, product_id, quantity):
+    return _record(product_id, RESERVATION, reserved_delta=quantity, order_id=order.id)
+
+
+def release(order, product_id, quantity):
+    return _record(product_id, RELEASE, reserved_delta=-quantity, order_id=order.id)
+
+
+def cancel_reservations(order):
+    for item in order.items:
+        _record(item.product_id, CANCELLATION, reserved_delta=-item.quantity, order_id=order.id)
+
+
+def commit_sale(order):
+    for item in order.items:
+        _record(item.product_id, SALE, on_hand_delta=-item.quantity, reserved_delta=-item.quantity, order_id=order.id)
+
+
+def return_sale(order):
+    for item in order.items:
+        _record(item.product_id, RETURN, on_hand_delta=item.quantity, order_id=order.id)
+
+
+def adjust(product_id, delta, kind=ADJUSTMENT, note=None):
+    return _record(product_id, kind, on_hand_delta=delta, note=note)
+
+
+def ledger_position():
+    cursor = db.session.get(EventCursor, LEDGER_CURSOR)
+    return cursor.last_sequence if cursor else 0
+
+
+def stock_levels(product_ids=None):
+    """Existencias, reservas y disponible por producto: {product_id: StockLevel}.
+
+    Suma a los saldos compactados del producto los movimientos posteriores al
+    cursor del libro, en una sola consulta.
+    """
+    position = db.session.query(EventCursor.last_sequence).filter(EventCursor.name == LEDGER_CURSOR).scalar_subquery()
+    pending = db.session.query(
+        StockMovement.product_id.label('product_id'),
+        db.func.sum(StockMovement.on_hand_delta).label('on_hand'),
+        db.func.sum(StockMovement.reserved_delta).label('reserved'),
+    ).filter(StockMovement.id > db.func.coalesce(position, 0)).group_by(StockMovement.product_id).subquery()
+
+    query = db.session.query(
+        Product.id,
+        Product.stock + db.func.coalesce(pending.c.on_hand, 0),
+        Product.reserved + db.func.coalesce(pending.c.reserved, 0),
+    ).outerjoin(pending, pending.c.product_id == Product.id)
+    if product_ids is not None:
+        query = query.filter(Product.id.in_(product_ids))
+
+    levels = {}
+    for product_id, on_hand, reserved in query:
+        on_hand, reserved = on_hand or 0, reserved or 0
+        levels[product_id] = StockLevel(on_hand, reserved, on_hand - reserved)
+    return levels
+
+
+def stock_level(product_id):
+    return stock_levels([product_id]).get(product_id, StockLevel(0, 0, 0))
+
+
+@task('compact_stock_ledger', every=COMPACT_EVERY)
+def compact_stock_ledger():
+    """Vuelca los movimientos nuevos del libro en los saldos de cada producto.
+
+    Los movimientos no se borran (el libro sigue siendo auditable); solo avanza
+    el cursor. El avance es condicional, así dos compactaciones simultáneas no
+    suman dos veces el mismo tramo.
+    """
+    cursor = db.session.get(EventCursor, LEDGER_CURSOR)
+    if cursor is None:
+        cursor = EventCursor(name=LEDGER_CURSOR, last_sequence=0)
+        db.session.add(cursor)
+        db.session.commit()
+    start = cursor.last_sequence
+    end = db.session.query(db.func.max(StockMovement.id)).scalar() or 0
+    if end <= start:
+        return {'movements': 0, 'products': 0}
+
+    claimed = db.session.execute(
+        update(EventCursor)
+        .where(EventCursor.name == LEDGER_CURSOR, EventCursor.last_sequence == start)
+        .values(last_sequence=end)
+    )
+    if claimed.rowcount != 1:
+        db.session.rollback()
+        return {'movements': 0, 'products': 0, 'skipped': 'otra compactación en curso'}
+
+    totals = db.session.query(
+        StockMovement.product_id, db.func.count(StockMovement.id),
+        db.func.sum(StockMovement.on_hand_delta), db.func.sum(StockMovement.reserved_delta),
+    ).filter(StockMovement.id > start, StockMovement.id <= end).group_by(StockMovement.product_id).all()
+
+    movements = 0
+    for product_id, count, on_hand_delta, reserved_delta in totals:
+        movements += count
+        if on_hand_delta or reserved_delta:
+            db.session.execute(
+                update(Product).where(Product.id == product_id)
+                .values(stock=Product.stock + on_hand_delta, reserved=Product.reserved + reserved_delta)
+            )
+    db.session.commit()
+    return {'movements': movements, 'products': len(totals), 'ledger_position': end}
+
+
+def low_stock_products(threshold):
+    """Productos cuyo disponible es menor o igual al umbral, del más crítico al menos."""
+    levels = stock_levels()
+    products = Product.query.filter(Product.id.in_([pid for pid, level in levels.items() if level.available <= threshold])).all()
+    return sorted(((product, levels[product.id]) for product in products), key=lambda row: (row[1].available, row[0].name))
+
+
+def init_inventory(app):
+    app.config.setdefault('LOW_STOCK_THRESHOLD',
+                          int(os.environ.get('LOW_STOCK_THRESHOLD', DEFAULT_LOW_STOCK_THRESHOLD)))
@@ -0,0 +1,239 @@
+# Archivo: app/jobs.py
+import json
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
+import click
+from flask import g
+from sqlalchemy import update
+from . import db, branch_router
+from .models import Job
+
+# Registro de tareas disponibles: nombre -> función
+TASKS = {}
+# Tareas que el worker encola solo cada cierto intervalo: nombre -> timedelta
+PERIODIC_TASKS = {}
+# Cola de cada tarea (nombre -> cola) y reintentos automáticos ante un error (nombre -> cantidad)
+TASK_QUEUES = {}
+TASK_RETRIES = {}
+
+# Cola por defecto; las tareas ligadas a un equipo (p. ej. la impresora) usan su propia
+# cola y solo las procesa el worker que corre junto a ese equipo.
+DEFAULT_QUEUE = 'default'
+
+JOB_PENDING = 'Pendiente'
+JOB_RUNNING = 'En curso'
+JOB_DONE = 'Completado'
+JOB_FAILED = 'Fallido'
+
+# Un trabajo 'En curso' más viejo que esto se considera huérfano (worker caído) y se reencola
+STALE_AFTER = timedelta(minutes=30)
+
+# Cada cuántos segundos el worker revisa si hay tareas periódicas vencidas
+SCHEDULE_CHECK_INTERVAL = 30
+
+# Espera antes de cada reintento automático; se multiplica por el número de intento
+RETRY_BACKOFF = timedelta(seconds=5)
+
+
+def task(name=None, every=None, queue=DEFAULT_QUEUE, retries=0):
+    """Registra una función como tarea ejecutable por `flask worker`.
+
+    Con every=timedelta(...) el worker además la encola sola en cada sucursal
+    cuando pasó ese intervalo desde la última ejecución. Con retries=N, un error
+    vuelve a encolar el trabajo hasta N veces, cada vez con más espera.
+    """
+    def decorator(func):
+        task_name = name or func.__name__
+        TASKS[task_name] = func
+        TASK_QUEUES[task_name] = queue
+        TASK_RETRIES[task_name] = retries
+        if every is not None:
+            PERIODIC_TASKS[task_name] = every
+        return func
+    return decorator
+
+
+def job_values(name, delay=None, **kwargs):
+    """Columnas de un trabajo nuevo; también sirve para insertarlo con Core (insert(Job.__table__))."""
+    if name not in TASKS:
+        raise KeyError(f"Tarea desconocida: {name}")
+    return {'name': name, 'payload': json.dumps(kwargs), 'status': JOB_PENDING, 'queue': TASK_QUEUES[name],
+            'run_after': datetime.utcnow() + delay if delay else None}
+
+
+def enqueue(name, commit=True, delay=None, **kwargs):
+    """Encola una tarea registrada. Los argumentos deben ser serializables a JSON.
+
+    Con commit=False el trabajo queda en la sesión actual y se confirma junto con
+    el resto de cambios de la petición. Con delay=timedelta(...) no se ejecuta
+    antes de ese tiempo.
+    """
+    job = Job(**job_values(name, delay, **kwargs))
+    db.session.add(job)
+    if commit:
+        db.session.commit()
+    return job
+
+
+def claim_jobs(limit, queues=(DEFAULT_QUEUE,)):
+    """Reserva hasta `limit` trabajos pendientes; es seguro con varios workers a la vez."""
+    candidate_ids = [row[0] for row in db.session.query(Job.id)
+                     .filter(Job.status == JOB_PENDING, Job.queue.in_(queues),
+                             db.or_(Job.run_after.is_(None), Job.run_after <= datetime.utcnow()))
+                     .order_by(Job.id).limit(limit).all()]
+    claimed = []
+    for job_id in candidate_ids:
+        result = db.session.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status == JOB_PENDING)
+            .values(status=JOB_RUNNING, started_at=datetime.utcnow(), attempts=Job.attempts + 1)
+        )
+        if result.rowcount == 1:
+            claimed.append(job_id)
+    db.session.commit()
+    return claimed
+
+
+def schedule_periodic_tasks(now=None, queues=(DEFAULT_QUEUE,)):
+    """Encola las tareas periódicas vencidas de la sucursal activa.
+
+    Se basa en la tabla de trabajos: no se encola si ya hay uno pendiente o en
+    curso, o si se creó otro dentro del intervalo. Así varios workers no duplican.
+    """
+    now = now or datetime.utcnow()
+    scheduled = []
+    for name, interval in PERIODIC_TASKS.items():
+        if TASK_QUEUES[name] not in queues:
+            continue
+        recent = db.session.query(Job.id).filter(
+            Job.name == name,
+            db.or_(Job.status.in_([JOB_PENDING, JOB_RUNNING]), Job.created_at > now - interval)
+        ).first()
+        if recent is None:
+            enqueue(name, commit=False)
+            scheduled.append(name)
+    db.session.commit()
+    return scheduled
+
+
+def requeue_stale_jobs():
+    cutoff = datetime.utcnow() - STALE_AFTER
+    result = db.session.execute(
+        update(Job)
+        .where(Job.status == JOB_RUNNING, Job.started_at < cutoff)
+        .values(status=JOB_PENDING, started_at=None)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def run_job(app, branch, job_id):
+    with app.app_context():
+        g.branch = branch
+        # Disponible para tareas que necesitan su propio registro (p. ej. para agrupar trabajos)
+        g.job_id = job_id
+        job = db.session.get(Job, job_id)
+        if job is None:
+            # Borrado después de reservarlo (p. ej. desde el admin o al restaurar una copia)
+            app.logger.warning("El trabajo %s de '%s' ya no existe; se omite.", job_id, branch)
+            return
+        func = TASKS.get(job.name)
+        try:
+            if func is None:
+                raise KeyError(f"Tarea desconocida: {job.name}")
+            result = func(**json.loads(job.payload or '{}'))
+            job.status = JOB_DONE
+            job.result = json.dumps(result) if result is not None else None
+            job.error = None
+        except Exception:
+            error = traceback.format_exc()
+            db.session.rollback()
+            job = db.session.get(Job, job_id)
+            if job is None:
+                app.logger.warning("El trabajo %s de '%s' se borró mientras corría:\n%s", job_id, branch, error)
+                return
+            job.error = error
+            if job.attempts <= TASK_RETRIES.get(job.name, 0):
+                job.status = JOB_PENDING
+                job.started_at = None
+                job.run_after = datetime.utcnow() + RETRY_BACKOFF * job.attempts
+                db.session.commit()
+                return
+            job.status = JOB_FAILED
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+
+
+def run_worker(app, threads=2, poll_interval=1.0, once=False, queues=(DEFAULT_QUEUE,)):
+    """Bucle principal del worker: reserva trabajos y los ejecuta en un pool de hilos.
+
+    Recorre la cola de cada sucursal, tomando solo trabajos de `queues`. Con
+    once=True termina cuando no quedan trabajos listos para ejecutar (útil para
+    cron o pruebas).
+    """
+    with app.app_context():
+        branches = list(branch_router.branches)
+        for branch in branches:
+            with branch_router.use(branch):
+                requeued = requeue_stale_jobs()
+            if requeued:
+                app.logger.warning("Se reencolaron %s trabajos huérfanos en '%s'.", requeued, branch)
+
+    in_flight = set()
+    next_schedule_check = 0
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='job') as executor:
+        while True:
+            if PERIODIC_TASKS and time.monotonic() >= next_schedule_check:
+                for branch in branches:
+                    with app.app_context():
+                        g.branch = branch
+                        schedule_periodic_tasks(queues=queues)
+                next_schedule_check = time.monotonic() + SCHEDULE_CHECK_INTERVAL
+
+            claimed = []
+            for branch in branches:
+                free_slots = threads - len(in_flight)
+                if free_slots <= 0:
+                    break
+                with app.app_context():
+                    g.branch = branch
+                    job_ids = claim_jobs(free_slots, queues)
+                for job_id in job_ids:
+                    in_flight.add(executor.submit(run_job, app, branch, job_id))
+                claimed.extend(job_ids)
+
+            if in_flight:
+                done, _ = wait(in_flight, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                in_flight -= done
+            elif once:
+                break
+            elif not claimed:
+                time.sleep(poll_interval)
+
+
+@task('purge_finished_jobs')
+def purge_finished_jobs(days=30):
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    deleted = Job.query.filter(Job.status.in_([JOB_DONE, JOB_FAILED]), Job.finished_at < cutoff)\
+        .delete(synchronize_session=False)
+    db.session.commit()
+    return {'deleted': deleted}
+
+
+def init_jobs(app):
+    @app.cli.command('worker')
+    @click.option('--threads', default=2, show_default=True, help='Trabajos ejecutados en paralelo.')
+    @click.option('--poll-interval', default=1.0, show_default=True, help='Segundos entre consultas a la cola.')
+    @click.option('--once', is_flag=True, help='Procesar la cola pendiente y salir.')
+    @click.option('--queue', 'queues', multiple=True, default=[DEFAULT_QUEUE], show_default=True,
+                  help='Cola a procesar (se puede repetir).')
+    def worker_command(threads, poll_interval, once, queues):
+        """Ejecuta los trabajos en segundo plano encolados por la aplicación."""
+        task_names = sorted(name for name in TASKS if TASK_QUEUES[name] in queues)
+        print(f"Worker iniciado con {threads} hilos en {', '.join(queues)}. Tareas registradas: {', '.join(task_names) or '(ninguna)'}")
+        try:
+            run_worker(app, threads=threads, poll_interval=poll_interval, once=once, queues=queues)
+        except KeyboardInterrupt:
+            print("\nWorker detenido.")
@@ -1,8 +1,10 @@
 # Archivo: app/models.py
 from datetime import datetime
 from . import db
+from .branches import current_branch, user_session_id
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
+from sqlalchemy.orm import selectinload
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -26,23 +28,38 @@ class User(UserMixin, db.Model):
         return False
 
     def get_id(self):
-        return str(self.id)
+        return user_session_id(current_branch(), self.id)
 
 class Product(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), unique=True, nullable=False)
     price = db.Column(db.Float, nullable=False)
     type = db.Column(db.String(50), nullable=False)
+    # Saldos a la fecha de la última compactación del libro de stock; los niveles
+    # vigentes se calculan en inventory.stock_levels() sumando los movimientos posteriores.
     stock = db.Column(db.Integer, default=0)
+    reserved = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
 class Table(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     number = db.Column(db.Integer, unique=True, nullable=False)
     capacity = db.Column(db.Integer, nullable=False)
     status = db.Column(db.String(20), default='Vacía')
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     orders = db.relationship('Order', back_populates='table_assigned', lazy='dynamic')
 
+    # Control de concurrencia optimista: cada UPDATE incrementa `version` y falla
+    # (StaleDataError) si otro mozo modificó la fila desde que se leyó.
+    __mapper_args__ = {'version_id_col': version}
+
 class Order(db.Model):
+    # AUTOINCREMENT: un id de pedido borrado no se reutiliza (el registro de eventos lo referencia)
+    __table_args__ = (
+        # Reporte por mozo: rango de fechas de cobro y agrupado por quien abrió el pedido
+        db.Index('ix_order_paid_at_opened_by_id', 'paid_at', 'opened_by_id'),
+        {'sqlite_autoincrement': True},
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     type = db.Column(db.String(20), nullable=False)
     status = db.Column(db.String(20), nullable=False, default='Pendiente')
@@ -52,9 +69,18 @@ class Order(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     table_id = db.Column(db.Integer, db.ForeignKey('table.id'), nullable=True)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    # Quién abrió el pedido y quién lo cobró (NULL en pedidos anteriores a la atribución)
+    opened_by_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True, index=True)
+    paid_by_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True, index=True)
+    paid_at = db.Column(db.DateTime, nullable=True)
     table_assigned = db.relationship('Table', back_populates='orders')
+    opened_by = db.relationship('User', foreign_keys=[opened_by_id])
+    paid_by = db.relationship('User', foreign_keys=[paid_by_id])
     items = db.relationship('OrderItem', back_populates='order', cascade="all, delete-orphan")
 
+    __mapper_args__ = {'version_id_col': version}
+
     def calculate_total(self):
         total_calculado = sum(item.subtotal for item in self.items if item.subtotal is not None)
         self.total_amount = total_calculado
@@ -66,13 +92,87 @@ class OrderItem(db.Model):
     quantity = db.Column(db.Integer, nullable=False)
     unit_price = db.Column(db.Float, nullable=False)
     subtotal = db.Column(db.Float, nullable=False)
+    added_by_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True, index=True)
     
     order = db.relationship('Order', back_populates='items')
     product = db.relationship('Product')
+    added_by = db.relationship('User')
 
     def __init__(self, **kwargs):
         super(OrderItem, self).__init__(**kwargs)
         self.calculate_subtotal()
 
     def calculate_subtotal(self):
-        self.subtotal = self.quantity * self.unit_price
\ No newline at end of file
+        self.subtotal = self.quantity * self.unit_price
+
+
+def load_items_with_products():
+    """Opción de carga para pedidos cuyos ítems se muestran con su producto.
+
+    Trae los ítems y sus productos en dos consultas adicionales fijas, en lugar de
+    una consulta por ítem desde la plantilla (N+1).
+    """
+    return selectinload(Order.items).selectinload(OrderItem.product)
+
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    status = db.Column(db.String(20), nullable=False, default='Pendiente', index=True)
+    queue = db.Column(db.String(30), nullable=False, default='default', server_default='default', index=True)
+    run_after = db.Column(db.DateTime, nullable=True)
+    result = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+class OrderEvent(db.Model):
+    # Registro de solo inserción: `id` es el número de secuencia que usan los consumidores.
+    # Sin FK a order: los eventos deben sobrevivir al borrado del pedido.
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, nullable=False, index=True)
+    event_type = db.Column(db.String(30), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Solo para que el ORM complete order_id al insertar junto a un pedido nuevo
+    order = db.relationship('Order', primaryjoin='foreign(OrderEvent.order_id) == Order.id')
+
+class EventCursor(db.Model):
+    # Posición de cada consumidor incremental en el registro de eventos
+    name = db.Column(db.String(100), primary_key=True)
+    last_sequence = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class CacheVersion(db.Model):
+    # Versión de cada caché en memoria de los workers (ver cache.py); se incrementa
+    # en la misma transacción que el cambio que la invalida
+    __tablename__ = 'cache_version'
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
+class StockMovement(db.Model):
+    # Libro de stock de solo inserción: cada cambio de existencias queda registrado con su motivo.
+    # on_hand_delta modifica las existencias físicas; reserved_delta, lo apartado por pedidos abiertos.
+    __tablename__ = 'stock_movement'
+    __table_args__ = (
+        db.Index('ix_stock_movement_product_id_id', 'product_id', 'id'),
+        {'sqlite_autoincrement': True},
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)
+    on_hand_delta = db.Column(db.Integer, nullable=False, default=0)
+    reserved_delta = db.Column(db.Integer, nullable=False, default=0)
+    order_id = db.Column(db.Integer, nullable=True, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    note = db.Column(db.String(200), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    product = db.relationship('Product')
+    user = db.relationship('User')
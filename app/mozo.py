@@ -1,17 +1,35 @@
 # Archivo: app/mozo.py
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
-from .models import Table, Product, Order, OrderItem
+import json
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app
+from flask_login import current_user
+from .models import Table, Product, Order, OrderItem, load_items_with_products
 from . import db
 from .utils import mozo_required
 from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.exc import StaleDataError
 from collections import OrderedDict
 from datetime import datetime
 from flask_wtf.csrf import generate_csrf
+from markupsafe import Markup
+from .cache import FLOOR, cache_versions, fragment_cache
+from .profiling import query_budget
+from .branches import current_branch
+from . import events
+from . import inventory
+from . import printing
+from . import order_items
+from .streams import StreamMessage, StreamSource, source, stream_response, stream_view
 
 mozo_bp = Blueprint('mozo', __name__)
 
-def get_products_by_category():
-    products_query = Product.query.filter(Product.stock > 0).order_by(Product.type, Product.name).all()
+PAYMENT_METHODS = ['Efectivo', 'Tarjeta', 'Transferencia']
+CONFLICT_MESSAGE = 'Otro usuario modificó este pedido o mesa mientras tanto. Se muestra el estado actual; revíselo y vuelva a intentarlo.'
+# Fragmentos que el cliente puede pedir con la cabecera X-Fragment en lugar de una página completa
+TABLE_FRAGMENTS = ('order-panel', 'table-card')
+
+def get_products_by_category(levels):
+    products_query = [product for product in Product.query.order_by(Product.type, Product.name).all()
+                      if product.id in levels and levels[product.id].available > 0]
     products_by_cat = OrderedDict()
     preferred_categories = [
         "Sandwiches", "Hamburguesas", "Pizzas", "Milanesas al Plato", "Tostados & Especiales", 
@@ -29,179 +47,374 @@ def get_products_by_category():
             final_products_by_cat[cat_name] = prods_in_cat
     return final_products_by_cat
 
+def _render_product_picker():
+    levels = inventory.stock_levels()
+    return render_template('mozo/_product_picker.html', products_by_category=get_products_by_category(levels), stock_levels=levels)
+
+def render_product_picker():
+    # El selector de productos solo cambia cuando cambia el catálogo (incluido el stock),
+    # así que se sirve desde la caché de fragmentos mientras la versión sea la misma.
+    html = fragment_cache.get_or_render(
+        f'mozo/product_picker:{current_branch()}',
+        _render_product_picker
+    )
+    return Markup(html)
+
+def is_stale(instance):
+    # Los formularios envían la versión que vio el mozo; si no coincide, la vista estaba desactualizada
+    expected = request.form.get('version', type=int)
+    return expected is not None and expected != instance.version
+
+def order_state(order_id):
+    order = db.session.get(Order, order_id)
+    if order is None:
+        return {'order_id': order_id, 'order_status': None}
+    return {
+        'order_id': order.id, 'order_status': order.status, 'order_version': order.version,
+        'order_total': order.total_amount,
+        'table_status': order.table_assigned.status if order.table_assigned else None
+    }
+
+def order_conflict_json(order_id, message=CONFLICT_MESSAGE):
+    db.session.rollback()
+    return jsonify({'success': False, 'conflict': True, 'message': message, **order_state(order_id)}), 409
+
+def table_conflict_page(table_id, message=CONFLICT_MESSAGE):
+    db.session.rollback()
+    if requested_fragment():
+        return render_table_fragment(Table.query.get_or_404(table_id), message, 'warning'), 409
+    flash(message, 'warning')
+    return render_table_detail(Table.query.get_or_404(table_id)), 409
+
+def takeaway_conflict_page(order_id, message=CONFLICT_MESSAGE):
+    db.session.rollback()
+    flash(message, 'warning')
+    order = Order.query.options(load_items_with_products()).filter_by(id=order_id, type='Para Llevar').first_or_404()
+    return render_takeaway_detail(order), 409
+
+def order_conflict_page(order_id, order_type, table_id):
+    # Los ids se capturan antes del commit: tras un StaleDataError la sesión debe descartarse
+    if order_type == 'Mesa' and table_id:
+        return table_conflict_page(table_id)
+    return takeaway_conflict_page(order_id)
+
 @mozo_bp.route('/tables')
 @mozo_required
+@query_budget(4)
 def tables_view():
-    tables_query = Table.query.order_by(Table.number).all()
-    tables_data = []
-    for table in tables_query:
-        active_order = Order.query.filter_by(table_id=table.id, status='Activo').first()
-        total_pedido_activo = active_order.total_amount if active_order else 0.0
-        table_info = {
-            'id': table.id,
-            'number': table.number,
-            'capacity': table.capacity,
-            'status': table.status,
-            'total_pedido_activo': total_pedido_activo
-        }
-        tables_data.append(table_info)
-    return render_template('mozo/tables.html', tables_data=tables_data, title="Mesas del Restaurante")
+    return render_template('mozo/tables.html', tables_data=floor_tables(), title="Mesas del Restaurante")
 
-@mozo_bp.route('/table/<int:table_id>')
+@mozo_bp.route('/floor/stream')
 @mozo_required
-def table_detail_view(table_id):
-    table_instance = Table.query.get_or_404(table_id)
-    current_order = Order.query.filter_by(table_id=table_instance.id, status='Activo').first()
-    products_by_category = get_products_by_category()
-    
-    payment_methods = ['Efectivo', 'Tarjeta', 'Transferencia']
+@stream_view
+def floor_stream():
+    # La vista de mesas se entera de los cambios hechos por otros mozos sin recargar
+    return stream_response('floor', current_branch())
+
+def floor_tables():
+    tables_query = Table.query.order_by(Table.number).all()
+    # Una sola consulta para los pedidos activos de todas las mesas
+    active_orders = {order.table_id: order for order in Order.query.filter(Order.table_id.isnot(None), Order.status == 'Activo')}
+    return [table_card_info(table, active_orders.get(table.id)) for table in tables_query]
+
+@source('floor')
+class FloorSource(StreamSource):
+    def version(self):
+        return cache_versions.get(FLOOR, self.branch)
+
+    def build(self, version):
+        state = {info['id']: {'status': info['status'], 'total': info['total_pedido_activo']} for info in floor_tables()}
+        return StreamMessage(version, 'floor', json.dumps({'tables': state}, ensure_ascii=False))
+
+def table_card_info(table, active_order):
+    return {
+        'id': table.id,
+        'number': table.number,
+        'capacity': table.capacity,
+        'status': table.status,
+        'total_pedido_activo': active_order.total_amount if active_order else 0.0
+    }
+
+def active_table_order(table_id, with_items=False):
+    query = Order.query.filter_by(table_id=table_id, status='Activo')
+    if with_items:
+        query = query.options(load_items_with_products())
+    return query.first()
+
+def requested_fragment():
+    fragment = request.headers.get('X-Fragment')
+    return fragment if fragment in TABLE_FRAGMENTS else None
+
+def render_order_panel(table, message=None, category=None):
+    return render_template('mozo/_order_panel.html', table=table, current_order=active_table_order(table.id, with_items=True),
+                           payment_methods=PAYMENT_METHODS, message=message, category=category)
+
+def render_table_card(table):
+    return render_template('mozo/_table_card.html', table_info=table_card_info(table, active_table_order(table.id)))
+
+def render_table_fragment(table, message=None, category=None):
+    if requested_fragment() == 'table-card':
+        return render_table_card(table)
+    return render_order_panel(table, message, category)
+
+def table_action_response(table_id, message, category, redirect_url):
+    """Respuesta de las acciones sobre una mesa: el fragmento pedido o, si no, flash y redirección."""
+    if table_id and requested_fragment():
+        return render_table_fragment(Table.query.get_or_404(table_id), message, category)
+    flash(message, category)
+    return redirect(redirect_url)
+
+def render_table_detail(table_instance):
+    current_order = active_table_order(table_instance.id, with_items=True)
+    product_picker = render_product_picker() if current_order else None
 
     return render_template('mozo/table_detail.html', 
                            table=table_instance, 
                            current_order=current_order, 
-                           products_by_category=products_by_category,
-                           payment_methods=payment_methods,
+                           product_picker=product_picker,
+                           payment_methods=PAYMENT_METHODS,
                            title=f"Mesa {table_instance.number}")
 
+@mozo_bp.route('/table/<int:table_id>')
+@mozo_required
+@query_budget(8)
+def table_detail_view(table_id):
+    return render_table_detail(Table.query.get_or_404(table_id))
+
+@mozo_bp.route('/table/<int:table_id>/panel')
+@mozo_required
+@query_budget(6)
+def order_panel_fragment(table_id):
+    return render_order_panel(Table.query.get_or_404(table_id))
+
+@mozo_bp.route('/table/<int:table_id>/card')
+@mozo_required
+@query_budget(4)
+def table_card_fragment(table_id):
+    return render_table_card(Table.query.get_or_404(table_id))
+
+@mozo_bp.route('/product_picker')
+@mozo_required
+def product_picker_fragment():
+    # El panel de añadir productos lo pide al iniciar un pedido sin recargar la página
+    return render_product_picker()
+
 @mozo_bp.route('/table/<int:table_id>/start_order', methods=['POST'])
 @mozo_required
 def start_table_order(table_id):
     table = Table.query.get_or_404(table_id)
+    if is_stale(table):
+        return table_conflict_page(table.id)
     if table.status == 'Vacía':
-        new_order = Order(type='Mesa', table_id=table.id, status='Activo')
+        new_order = Order(type='Mesa', table_id=table.id, status='Activo', opened_by_id=current_user.id)
         db.session.add(new_order)
         table.status = 'Ocupada'
-        db.session.commit()
-        flash('Nuevo pedido iniciado en la mesa.', 'success')
+        events.record_order_event(new_order, events.ORDER_CREATED, type='Mesa', table_id=table.id)
+        try:
+            db.session.commit()
+        except StaleDataError:
+            return table_conflict_page(table_id)
+        message, category = 'Nuevo pedido iniciado en la mesa.', 'success'
     else:
-        flash('La mesa ya se encuentra ocupada.', 'warning')
-    return redirect(url_for('mozo.table_detail_view', table_id=table.id))
+        message, category = 'La mesa ya se encuentra ocupada.', 'warning'
+    return table_action_response(table_id, message, category, url_for('mozo.table_detail_view', table_id=table_id))
 
 @mozo_bp.route('/order/<int:order_id>/add_item', methods=['POST'])
 @mozo_required
 def add_item_to_order(order_id):
-    order = Order.query.get_or_404(order_id)
     product_id = request.form.get('product_id', type=int)
     quantity = request.form.get('quantity', type=int, default=1)
     
     if product_id is None or quantity <= 0:
         return jsonify({'success': False, 'message': 'Seleccione un producto y una cantidad válida.'}), 400
 
+    add = order_items.add_item if current_app.config['ORDER_ITEMS_FAST_PATH'] else add_item_orm
+    try:
+        added = add(order_id, product_id, quantity, current_user.id)
+    except order_items.InsufficientStock as e:
+        return jsonify({'success': False, 'message': e.message}), 400
+    except order_items.OrderNotOpen as e:
+        return order_conflict_json(e.order_id, e.message)
+    except order_items.OrderChanged as e:
+        return order_conflict_json(e.order_id)
+    
+    return jsonify({
+        'success': True, 'message': f'{added.product_name} añadido correctamente.', 'order_total': added.order_total,
+        'order_version': added.order_version,
+        'item': {
+            'id': added.item_id, 'name': added.product_name, 'quantity': added.quantity,
+            'unit_price': added.unit_price, 'subtotal': added.subtotal
+        },
+        'product_stock': added.available
+    })
+
+@mozo_bp.route('/order_item/<int:item_id>/remove', methods=['POST'])
+@mozo_required
+def remove_item_from_order(item_id):
+    remove = order_items.remove_item if current_app.config['ORDER_ITEMS_FAST_PATH'] else remove_item_orm
+    try:
+        removed = remove(item_id)
+    except order_items.OrderNotOpen as e:
+        return order_conflict_json(e.order_id, e.message)
+    except order_items.OrderChanged as e:
+        return order_conflict_json(e.order_id)
+
+    return jsonify({
+        'success': True, 'message': 'Ítem eliminado.', 'order_total': removed.order_total, 'order_version': removed.order_version,
+        'product_stock': inventory.stock_level(removed.product_id).available
+    })
+
+# Implementación con el ORM, equivalente a la de order_items; queda para comparar
+# (flask bench-order-items) y como alternativa con ORDER_ITEMS_FAST_PATH=0.
+
+def add_item_orm(order_id, product_id, quantity, user_id):
+    order = Order.query.get_or_404(order_id)
+    if order.status not in order_items.OPEN_STATUSES:
+        raise order_items.OrderNotOpen(f'El pedido #{order.id} ya no está abierto ({order.status}).', order.id)
+
     product = Product.query.get_or_404(product_id)
 
-    if product.stock < quantity:
-        return jsonify({'success': False, 'message': f'Stock insuficiente para {product.name}. Stock actual: {product.stock}.'}), 400
+    available = inventory.stock_level(product.id).available
+    if available < quantity:
+        raise order_items.InsufficientStock(f'Stock insuficiente para {product.name}. Stock disponible: {available}.')
 
     order_item = OrderItem.query.filter_by(order_id=order.id, product_id=product.id).first()
     if order_item:
         order_item.quantity += quantity
     else:
-        order_item = OrderItem(order_id=order.id, product_id=product.id, quantity=quantity, unit_price=product.price)
+        # Una línea que se vuelve a sumar conserva a quien la cargó primero
+        order_item = OrderItem(order_id=order.id, product_id=product.id, quantity=quantity, unit_price=product.price,
+                               added_by_id=user_id)
         db.session.add(order_item)
     
     order_item.calculate_subtotal()
-    product.stock -= quantity
+    inventory.reserve(order, product.id, quantity)
+    printing.queue_comanda(order, product, quantity)
     
     order.calculate_total()
-    db.session.commit()
+    events.record_order_event(order, events.ITEM_ADDED, product_id=product.id, quantity=quantity,
+                              unit_price=order_item.unit_price, order_total=order.total_amount)
+    try:
+        db.session.commit()
+    except StaleDataError:
+        raise order_items.OrderChanged(order_id=order_id)
     
-    return jsonify({
-        'success': True, 'message': f'{product.name} añadido correctamente.', 'order_total': order.total_amount,
-        'item': {
-            'id': order_item.id, 'name': product.name, 'quantity': order_item.quantity,
-            'unit_price': order_item.unit_price, 'subtotal': order_item.subtotal
-        },
-        'product_stock': product.stock
-    })
+    return order_items.AddedItem(order_item.id, product.id, product.name, order_item.quantity, order_item.unit_price,
+                                 order_item.subtotal, order.total_amount, order.version, available - quantity)
 
-@mozo_bp.route('/order_item/<int:item_id>/remove', methods=['POST'])
-@mozo_required
-def remove_item_from_order(item_id):
-    order_item = OrderItem.query.options(selectinload(OrderItem.order), selectinload(OrderItem.product)).get_or_404(item_id)
+def remove_item_orm(item_id):
+    order_item = OrderItem.query.options(selectinload(OrderItem.order)).get_or_404(item_id)
     order = order_item.order
-    product = order_item.product
+    order_id, product_id = order.id, order_item.product_id
     
-    if order.status not in ['Activo', 'Pendiente']:
-        return jsonify({'success': False, 'message': 'No se pueden quitar ítems de un pedido que no esté activo o pendiente.'}), 400
+    if order.status not in order_items.OPEN_STATUSES:
+        raise order_items.OrderNotOpen('No se pueden quitar ítems de un pedido que no esté activo o pendiente.', order_id)
 
-    if product:
-        product.stock += order_item.quantity
-    
+    inventory.release(order, order_item.product_id, order_item.quantity)
     db.session.delete(order_item)
     
     order.calculate_total()
-    db.session.commit()
+    events.record_order_event(order, events.ITEM_REMOVED, product_id=order_item.product_id,
+                              quantity=order_item.quantity, order_total=order.total_amount)
+    try:
+        db.session.commit()
+    except StaleDataError:
+        raise order_items.OrderChanged(order_id=order_id)
 
-    return jsonify({
-        'success': True, 'message': 'Ítem eliminado.', 'order_total': order.total_amount, 'product_stock': product.stock if product else 0
-    })
+    return order_items.RemovedItem(order_id, product_id, order.total_amount, order.version)
 
 @mozo_bp.route('/order/<int:order_id>/mark_paid', methods=['POST'])
 @mozo_required
 def mark_order_paid(order_id):
     order = Order.query.get_or_404(order_id)
     payment_method = request.form.get('payment_method')
+    order_type, table_id = order.type, order.table_id
+
+    if is_stale(order):
+        return order_conflict_page(order_id, order_type, table_id)
 
     if not payment_method:
-        flash('Debe seleccionar un método de pago.', 'danger')
+        message, category = 'Debe seleccionar un método de pago.', 'danger'
     elif order.status in ['Activo', 'Pendiente'] and order.items:
         order.status = 'Pagado'
         order.payment_method = payment_method
-        order.updated_at = datetime.utcnow()
+        order.paid_at = order.updated_at = datetime.utcnow()
+        order.paid_by_id = current_user.id
         if order.table_assigned:
             order.table_assigned.status = 'Vacía'
-        db.session.commit()
-        flash(f'Pedido #{order.id} marcado como pagado con {payment_method}.', 'success')
+        inventory.commit_sale(order)
+        printing.queue_receipt(order)
+        events.record_order_event(order, events.ORDER_PAID, payment_method=payment_method, total=order.total_amount)
+        try:
+            db.session.commit()
+        except StaleDataError:
+            return order_conflict_page(order_id, order_type, table_id)
+        message, category = f'Pedido #{order_id} marcado como pagado con {payment_method}.', 'success'
     else:
-        flash('El pedido no se puede marcar como pagado o no tiene ítems.', 'warning')
-    
-    return redirect(url_for('mozo.tables_view'))
+        message, category = 'El pedido no se puede marcar como pagado o no tiene ítems.', 'warning'
+
+    return table_action_response(table_id, message, category, url_for('mozo.tables_view'))
 
 
 @mozo_bp.route('/table/<int:table_id>/liberate', methods=['POST'])
 @mozo_required
 def liberate_table(table_id):
     table = Table.query.get_or_404(table_id)
+    if is_stale(table):
+        return table_conflict_page(table.id)
     active_order = Order.query.filter_by(table_id=table.id, status='Activo').first()
 
     if active_order and active_order.items:
-        flash(f'No se puede liberar la mesa {table.number} porque tiene un pedido activo con ítems. Cancele o cobre el pedido primero.', 'danger')
-        return redirect(url_for('mozo.table_detail_view', table_id=table.id))
+        return table_action_response(
+            table_id, f'No se puede liberar la mesa {table.number} porque tiene un pedido activo con ítems. Cancele o cobre el pedido primero.',
+            'danger', url_for('mozo.table_detail_view', table_id=table_id))
 
     if active_order:
+        events.record_order_event(active_order, events.ORDER_DELETED, status='Eliminado')
         db.session.delete(active_order)
 
     table.status = 'Vacía'
-    db.session.commit()
-    flash(f'Mesa {table.number} liberada y pedido vacío eliminado.', 'success')
-    return redirect(url_for('mozo.tables_view'))
+    try:
+        db.session.commit()
+    except StaleDataError:
+        return table_conflict_page(table_id)
+    return table_action_response(table_id, f'Mesa {table.number} liberada y pedido vacío eliminado.', 'success', url_for('mozo.tables_view'))
 
 @mozo_bp.route('/order/<int:order_id>/cancel', methods=['POST'])
 @mozo_required
 def cancel_order(order_id):
     order = Order.query.get_or_404(order_id)
     order_type = order.type
+    table_id = order.table_id
+
+    if is_stale(order):
+        return order_conflict_page(order_id, order_type, table_id)
 
-    if order.status in ['Activo', 'Pendiente']:
-        for item in order.items:
-            if item.product:
-                item.product.stock += item.quantity
+    if order.status in ['Activo', 'Pendiente', 'Listo']:
+        inventory.cancel_reservations(order)
         order.status = 'Cancelado'
         order.updated_at = datetime.utcnow()
         if order.table_assigned and order.table_assigned.status == 'Ocupada':
             order.table_assigned.status = 'Vacía'
-        db.session.commit()
-        flash(f'Pedido #{order.id} cancelado. El stock ha sido devuelto.', 'success')
+        events.record_order_event(order, events.ORDER_CANCELLED, total=order.total_amount)
+        try:
+            db.session.commit()
+        except StaleDataError:
+            return order_conflict_page(order_id, order_type, table_id)
+        message, category = f'Pedido #{order_id} cancelado. El stock ha sido devuelto.', 'success'
     else:
-        flash('Este pedido no se puede cancelar.', 'warning')
+        message, category = 'Este pedido no se puede cancelar.', 'warning'
 
-    redirect_url = url_for('mozo.takeaway_orders_view') if order_type == 'Para Llevar' else url_for('mozo.tables_view')
-    return redirect(redirect_url)
+    if order_type == 'Para Llevar':
+        flash(message, category)
+        return redirect(url_for('mozo.takeaway_orders_view'))
+    return table_action_response(table_id, message, category, url_for('mozo.tables_view'))
 
 # --- RUTAS PARA LLEVAR ---
 
 @mozo_bp.route('/takeaway')
 @mozo_required
+@query_budget(3)
 def takeaway_orders_view():
     orders = Order.query.filter_by(type='Para Llevar').order_by(Order.created_at.desc()).all()
     return render_template('mozo/takeaway_orders.html', orders=orders, title="Pedidos para Llevar")
@@ -214,8 +427,9 @@ def new_takeaway_order():
         if not customer_name:
             flash('El nombre del cliente es obligatorio para crear un pedido.', 'danger')
         else:
-            new_order = Order(type='Para Llevar', customer_name=customer_name, status='Pendiente')
+            new_order = Order(type='Para Llevar', customer_name=customer_name, status='Pendiente', opened_by_id=current_user.id)
             db.session.add(new_order)
+            events.record_order_event(new_order, events.ORDER_CREATED, type='Para Llevar', customer_name=customer_name)
             db.session.commit()
             flash(f"Pedido para '{customer_name}' creado con éxito. Ahora puede añadir ítems.", 'success')
             return redirect(url_for('mozo.takeaway_order_detail', order_id=new_order.id))
@@ -223,16 +437,22 @@ def new_takeaway_order():
 
 @mozo_bp.route('/takeaway/<int:order_id>', methods=['GET', 'POST'])
 @mozo_required
+@query_budget(8)
 def takeaway_order_detail(order_id):
-    order = Order.query.filter_by(id=order_id, type='Para Llevar').first_or_404()
-    payment_methods = ['Efectivo', 'Tarjeta', 'Transferencia']
+    order = Order.query.options(load_items_with_products()).filter_by(id=order_id, type='Para Llevar').first_or_404()
 
     if request.method == 'POST':
+        if is_stale(order):
+            return takeaway_conflict_page(order.id)
         if order.status == 'Pendiente':
             customer_name = request.form.get('customer_name', '').strip()
             if customer_name:
                 order.customer_name = customer_name
-                db.session.commit()
+                events.record_order_event(order, events.ORDER_UPDATED, customer_name=customer_name)
+                try:
+                    db.session.commit()
+                except StaleDataError:
+                    return takeaway_conflict_page(order_id)
                 flash('Nombre del cliente actualizado.', 'success')
             else:
                 flash('El nombre del cliente no puede estar vacío.', 'danger')
@@ -240,11 +460,13 @@ def takeaway_order_detail(order_id):
             flash('No se puede editar un pedido que no esté en estado "Pendiente".', 'warning')
         return redirect(url_for('mozo.takeaway_order_detail', order_id=order.id))
 
-    products_by_category = get_products_by_category()
+    return render_takeaway_detail(order)
+
+def render_takeaway_detail(order):
     return render_template('mozo/takeaway_form.html', 
                            order=order, 
-                           products_by_category=products_by_category, 
-                           payment_methods=payment_methods,
+                           product_picker=render_product_picker(), 
+                           payment_methods=PAYMENT_METHODS,
                            action="Editar", 
                            title=f"Pedido Llevar #{order.id}")
 
@@ -258,11 +480,21 @@ def mark_takeaway_paid(order_id):
         flash('Debe seleccionar un método de pago.', 'danger')
         return redirect(url_for('mozo.takeaway_order_detail', order_id=order.id))
 
+    if is_stale(order):
+        return takeaway_conflict_page(order.id)
+
     if order.status in ['Pendiente', 'Listo'] and order.items:
         order.status = 'Pagado'
         order.payment_method = payment_method
-        order.updated_at = datetime.utcnow()
-        db.session.commit()
+        order.paid_at = order.updated_at = datetime.utcnow()
+        order.paid_by_id = current_user.id
+        inventory.commit_sale(order)
+        printing.queue_receipt(order)
+        events.record_order_event(order, events.ORDER_PAID, payment_method=payment_method, total=order.total_amount)
+        try:
+            db.session.commit()
+        except StaleDataError:
+            return takeaway_conflict_page(order_id)
         flash(f'Pedido para llevar #{order_id} pagado con {payment_method}.', 'success')
     else:
         flash('El pedido no se puede marcar como pagado, o está vacío.', 'warning')
@@ -270,6 +502,26 @@ def mark_takeaway_paid(order_id):
 
     return redirect(url_for('mozo.takeaway_orders_view'))
 
+@mozo_bp.route('/takeaway/<int:order_id>/mark_ready', methods=['POST'])
+@mozo_required
+def mark_takeaway_ready(order_id):
+    order = Order.query.filter_by(id=order_id, type='Para Llevar').first_or_404()
+    if is_stale(order):
+        return takeaway_conflict_page(order.id)
+
+    if order.status == 'Pendiente' and order.items:
+        order.status = 'Listo'
+        order.updated_at = datetime.utcnow()
+        events.record_order_event(order, events.ORDER_READY)
+        try:
+            db.session.commit()
+        except StaleDataError:
+            return takeaway_conflict_page(order_id)
+        flash(f'Pedido #{order_id} listo para retirar.', 'success')
+    else:
+        flash('Solo se puede marcar como listo un pedido pendiente con ítems.', 'warning')
+    return redirect(url_for('mozo.takeaway_orders_view'))
+
 @mozo_bp.route('/takeaway/<int:order_id>/delete', methods=['POST'])
 @mozo_required
 def delete_takeaway_order(order_id):
@@ -278,7 +530,13 @@ def delete_takeaway_order(order_id):
         flash('Solo se pueden eliminar pedidos que ya han sido procesados (pagados o cancelados).', 'warning')
     else:
         # Los items se borran en cascada por la configuración en el modelo
+        events.record_order_event(order, events.ORDER_DELETED, previous_status=order.status, status='Eliminado')
         db.session.delete(order)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except StaleDataError:
+            db.session.rollback()
+            flash(CONFLICT_MESSAGE, 'warning')
+            return takeaway_orders_view(), 409
         flash(f'Pedido #{order.id} eliminado del historial visible.', 'success')
     return redirect(url_for('mozo.takeaway_orders_view'))
\ No newline at end of file
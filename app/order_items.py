@@ -0,0 +1,311 @@
+# Archivo: app/order_items.py
+import os
+import time
+from collections import namedtuple
+import click
+from flask import abort
+from sqlalchemy import bindparam, delete, event, func, insert, select, update
+from sqlalchemy.engine import Engine
+from . import db
+from . import events
+from . import inventory
+from . import printing
+from .cache import FLOOR, mark_catalogue_dirty, mark_dirty
+from .models import Job, Order, OrderEvent, OrderItem, Product, StockMovement, Table, User
+
+# Ruta rápida para agregar y quitar ítems, los dos endpoints más usados en hora pico.
+# En lugar del unit of work del ORM (identity map, carga de order.items para recalcular
+# el total y flush de cada objeto modificado) ejecuta las sentencias mínimas con Core
+# sobre la conexión de la sesión, dentro de la misma transacción y con el mismo control
+# de versión del pedido. Las sentencias se arman una sola vez con bindparam, así la
+# caché de compilación de SQLAlchemy las reutiliza en cada petición.
+
+OPEN_STATUSES = ('Activo', 'Pendiente')
+
+order_t = Order.__table__
+item_t = OrderItem.__table__
+product_t = Product.__table__
+table_t = Table.__table__
+
+_SELECT_ORDER = (
+    select(order_t.c.id, order_t.c.status, order_t.c.type, order_t.c.customer_name, table_t.c.number.label('table_number'))
+    .select_from(order_t.outerjoin(table_t, order_t.c.table_id == table_t.c.id))
+    .where(order_t.c.id == bindparam('_order_id'))
+)
+_SELECT_PRODUCT = select(product_t.c.id, product_t.c.name, product_t.c.price, product_t.c.type)\
+    .where(product_t.c.id == bindparam('_product_id'))
+_SELECT_ITEM = (
+    select(item_t.c.id, item_t.c.order_id, item_t.c.product_id, item_t.c.quantity, order_t.c.status)
+    .select_from(item_t.join(order_t, item_t.c.order_id == order_t.c.id))
+    .where(item_t.c.id == bindparam('_item_id'))
+)
+
+# Suma a la línea existente del producto, si la hay
+_ADD_TO_LINE = (
+    update(item_t)
+    .where(item_t.c.order_id == bindparam('_order_id'), item_t.c.product_id == bindparam('_product_id'))
+    .values(quantity=item_t.c.quantity + bindparam('_quantity'),
+            subtotal=(item_t.c.quantity + bindparam('_quantity')) * item_t.c.unit_price)
+)
+_ADD_TO_LINE_RETURNING = _ADD_TO_LINE.returning(item_t.c.id, item_t.c.quantity, item_t.c.unit_price, item_t.c.subtotal)
+_SELECT_LINE = select(item_t.c.id, item_t.c.quantity, item_t.c.unit_price, item_t.c.subtotal)\
+    .where(item_t.c.order_id == bindparam('_order_id'), item_t.c.product_id == bindparam('_product_id'))
+_DELETE_LINE = delete(item_t).where(item_t.c.id == bindparam('_item_id'))
+
+# Recalcula el total en la base y sube la versión del pedido (como haría el version_id_col
+# del ORM). Solo afecta pedidos abiertos: si otro mozo lo cobró o canceló, no toca nada.
+_TOUCH_ORDER = (
+    update(order_t)
+    .where(order_t.c.id == bindparam('_order_id'), order_t.c.status.in_(OPEN_STATUSES))
+    .values(total_amount=select(func.coalesce(func.sum(item_t.c.subtotal), 0.0))
+            .where(item_t.c.order_id == order_t.c.id).scalar_subquery(),
+            version=order_t.c.version + 1)
+)
+_TOUCH_ORDER_RETURNING = _TOUCH_ORDER.returning(order_t.c.version, order_t.c.total_amount)
+_SELECT_ORDER_TOTALS = select(order_t.c.version, order_t.c.total_amount).where(order_t.c.id == bindparam('_order_id'))
+
+_INSERT_ITEM = insert(item_t)
+_INSERT_MOVEMENT = insert(StockMovement.__table__)
+_INSERT_JOB = insert(Job.__table__)
+_INSERT_EVENT = insert(OrderEvent.__table__)
+
+AddedItem = namedtuple('AddedItem', ['item_id', 'product_id', 'product_name', 'quantity', 'unit_price', 'subtotal',
+                                     'order_total', 'order_version', 'available'])
+RemovedItem = namedtuple('RemovedItem', ['order_id', 'product_id', 'order_total', 'order_version'])
+
+
+class OrderItemError(Exception):
+    """Error que se informa al mozo; `order_id` permite devolver el estado actual del pedido."""
+
+    def __init__(self, message=None, order_id=None):
+        super().__init__(message)
+        self.message = message
+        self.order_id = order_id
+
+
+class OrderNotOpen(OrderItemError):
+    pass
+
+
+class InsufficientStock(OrderItemError):
+    pass
+
+
+class OrderChanged(OrderItemError):
+    """Otro mozo cerró o modificó el pedido entre la lectura y la escritura."""
+
+
+# SQLite devuelve por RETURNING el valor calculado antes de aplicar la afinidad REAL
+# de la columna (7000 en lugar de 7000.0); se normaliza para responder igual que el ORM.
+
+def _add_to_line(conn, params):
+    if conn.dialect.update_returning:
+        line = conn.execute(_ADD_TO_LINE_RETURNING, params).first()
+    elif conn.execute(_ADD_TO_LINE, params).rowcount == 0:
+        return None
+    else:
+        line = conn.execute(_SELECT_LINE, params).first()
+    if line is None:
+        return None
+    return line.id, line.quantity, float(line.unit_price), float(line.subtotal)
+
+
+def _touch_order(conn, order_id):
+    params = {'_order_id': order_id}
+    if conn.dialect.update_returning:
+        totals = conn.execute(_TOUCH_ORDER_RETURNING, params).first()
+    elif conn.execute(_TOUCH_ORDER, params).rowcount == 0:
+        return None
+    else:
+        totals = conn.execute(_SELECT_ORDER_TOTALS, params).first()
+    if totals is None:
+        return None
+    return totals.version, float(totals.total_amount)
+
+
+def add_item(order_id, product_id, quantity, user_id):
+    """Agrega `quantity` unidades del producto al pedido y confirma. Devuelve un AddedItem."""
+    conn = db.session.connection()
+    order = conn.execute(_SELECT_ORDER, {'_order_id': order_id}).first()
+    if order is None:
+        abort(404)
+    if order.status not in OPEN_STATUSES:
+        raise OrderNotOpen(f'El pedido #{order_id} ya no está abierto ({order.status}).', order_id)
+    product = conn.execute(_SELECT_PRODUCT, {'_product_id': product_id}).first()
+    if product is None:
+        abort(404)
+
+    available = inventory.stock_level(product_id).available
+    if available < quantity:
+        raise InsufficientStock(f'Stock insuficiente para {product.name}. Stock disponible: {available}.')
+
+    params = {'_order_id': order_id, '_product_id': product_id, '_quantity': quantity}
+    line = _add_to_line(conn, params)
+    if line is None:
+        subtotal = quantity * product.price
+        item_id = conn.execute(_INSERT_ITEM, {
+            'order_id': order_id, 'product_id': product_id, 'quantity': quantity,
+            'unit_price': product.price, 'subtotal': subtotal, 'added_by_id': user_id,
+        }).inserted_primary_key[0]
+        line = (item_id, quantity, product.price, subtotal)
+    item_id, line_quantity, unit_price, line_subtotal = line
+
+    conn.execute(_INSERT_MOVEMENT, inventory.movement_values(product_id, inventory.RESERVATION, reserved_delta=quantity, order_id=order_id))
+    label = printing.label_for(order.type, order.table_number, order.customer_name)
+    conn.execute(_INSERT_JOB, printing.comanda_job_values(order_id, label, product, quantity))
+
+    totals = _touch_order(conn, order_id)
+    if totals is None:
+        db.session.rollback()
+        raise OrderChanged(order_id=order_id)
+    order_version, order_total = totals
+    conn.execute(_INSERT_EVENT, events.event_values(
+        order_id, events.ITEM_ADDED, order.status, product_id=product_id, quantity=quantity,
+        unit_price=unit_price, order_total=order_total))
+    mark_catalogue_dirty(db.session)
+    mark_dirty(db.session, FLOOR)
+    db.session.commit()
+
+    return AddedItem(item_id, product_id, product.name, line_quantity, unit_price, line_subtotal,
+                     order_total, order_version, available - quantity)
+
+
+def remove_item(item_id):
+    """Quita la línea completa del pedido y confirma. Devuelve un RemovedItem."""
+    conn = db.session.connection()
+    item = conn.execute(_SELECT_ITEM, {'_item_id': item_id}).first()
+    if item is None:
+        abort(404)
+    if item.status not in OPEN_STATUSES:
+        raise OrderNotOpen('No se pueden quitar ítems de un pedido que no esté activo o pendiente.', item.order_id)
+
+    if conn.execute(_DELETE_LINE, {'_item_id': item_id}).rowcount == 0:
+        # Otro mozo quitó la línea primero
+        db.session.rollback()
+        raise OrderChanged(order_id=item.order_id)
+    conn.execute(_INSERT_MOVEMENT, inventory.movement_values(
+        item.product_id, inventory.RELEASE, reserved_delta=-item.quantity, order_id=item.order_id))
+
+    totals = _touch_order(conn, item.order_id)
+    if totals is None:
+        db.session.rollback()
+        raise OrderChanged(order_id=item.order_id)
+    order_version, order_total = totals
+    conn.execute(_INSERT_EVENT, events.event_values(
+        item.order_id, events.ITEM_REMOVED, item.status, product_id=item.product_id,
+        quantity=item.quantity, order_total=order_total))
+    mark_catalogue_dirty(db.session)
+    mark_dirty(db.session, FLOOR)
+    db.session.commit()
+
+    return RemovedItem(item.order_id, item.product_id, order_total, order_version)
+
+
+# --- Benchmark: ruta ORM contra ruta rápida ---
+
+def _bench_fixture(user):
+    """Mesa y pedido de prueba, y el producto con más disponible para agregar y quitar."""
+    number = (db.session.query(func.max(Table.number)).scalar() or 0) + 1
+    table = Table(number=number, capacity=1, status='Ocupada')
+    db.session.add(table)
+    db.session.flush()
+    order = Order(type='Mesa', table_id=table.id, status='Activo', opened_by_id=user.id)
+    db.session.add(order)
+    db.session.commit()
+    levels = inventory.stock_levels()
+    product_id = max(levels, key=lambda pid: levels[pid].available) if levels else None
+    if product_id is None or levels[product_id].available < 1:
+        raise click.ClickException('No hay productos con stock disponible para el benchmark.')
+    return table.id, order.id, product_id
+
+
+def _bench_cleanup(table_id, order_id):
+    # Los movimientos y eventos se conservan (se compensan entre sí); los trabajos de
+    # impresión pendientes del pedido de prueba no deben llegar a la cocina.
+    db.session.rollback()
+    Job.query.filter(Job.name == 'print_comanda', Job.payload.like(f'{{"order_id": {order_id},%')).delete(synchronize_session=False)
+    order = db.session.get(Order, order_id)
+    if order is not None:
+        db.session.delete(order)
+    db.session.flush()
+    table = db.session.get(Table, table_id)
+    if table is not None:
+        db.session.delete(table)
+    db.session.commit()
+
+
+def _bench_mode(app, client, fast, order_id, product_id, rounds, warmup):
+    app.config['ORDER_ITEMS_FAST_PATH'] = fast
+    statements = {'count': 0}
+
+    def count_statement(*args):
+        statements['count'] += 1
+
+    samples = {'add': [], 'remove': []}
+    event.listen(Engine, 'before_cursor_execute', count_statement)
+    try:
+        for i in range(warmup + rounds):
+            statements['count'] = 0
+            started = time.process_time()
+            response = client.post(f'/mozo/order/{order_id}/add_item', data={'product_id': product_id, 'quantity': 1})
+            add_cpu, add_statements = time.process_time() - started, statements['count']
+            if response.status_code != 200:
+                raise click.ClickException(f'add_item respondió {response.status_code}: {response.get_data(as_text=True)[:200]}')
+            item_id = response.get_json()['item']['id']
+
+            statements['count'] = 0
+            started = time.process_time()
+            response = client.post(f'/mozo/order_item/{item_id}/remove')
+            remove_cpu, remove_statements = time.process_time() - started, statements['count']
+            if response.status_code != 200:
+                raise click.ClickException(f'remove respondió {response.status_code}')
+            if i >= warmup:
+                samples['add'].append((add_cpu, add_statements))
+                samples['remove'].append((remove_cpu, remove_statements))
+    finally:
+        event.remove(Engine, 'before_cursor_execute', count_statement)
+    return {name: (sum(cpu for cpu, _ in rows) / len(rows) * 1000, sum(n for _, n in rows) / len(rows))
+            for name, rows in samples.items()}
+
+
+def init_order_items(app):
+    app.config.setdefault('ORDER_ITEMS_FAST_PATH', os.environ.get('ORDER_ITEMS_FAST_PATH', '1') != '0')
+
+    @app.cli.command('bench-order-items')
+    @click.option('--rounds', default=300, show_default=True, help='Pares agregar/quitar medidos por modo.')
+    @click.option('--warmup', default=30, show_default=True, help='Pares iniciales que no se miden.')
+    @click.option('--yes', is_flag=True, help='No pedir confirmación.')
+    def bench_order_items_command(rounds, warmup, yes):
+        """Compara el CPU por petición de agregar/quitar ítems: ORM contra ruta rápida (Core).
+
+        Crea una mesa y un pedido de prueba en la sucursal activa y los borra al
+        terminar; conviene correrlo sobre una copia de la base de datos.
+        """
+        if not yes:
+            click.confirm(f"Se usará la base de la sucursal '{app.config['ACTIVE_BRANCH']}'. ¿Continuar?", abort=True)
+        user = User.query.filter_by(role='mozo').first() or User.query.first()
+        if user is None:
+            raise click.ClickException('No hay usuarios; ejecute flask seed-db primero.')
+        table_id, order_id, product_id = _bench_fixture(user)
+
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = user.get_id()
+            session['_fresh'] = True
+            session['branch'] = app.config['ACTIVE_BRANCH']
+        previous = app.config['WTF_CSRF_ENABLED'], app.config['ORDER_ITEMS_FAST_PATH']
+        app.config['WTF_CSRF_ENABLED'] = False
+        try:
+            results = {mode: _bench_mode(app, client, mode == 'rápida', order_id, product_id, rounds, warmup)
+                       for mode in ('ORM', 'rápida')}
+        finally:
+            app.config['WTF_CSRF_ENABLED'], app.config['ORDER_ITEMS_FAST_PATH'] = previous
+            _bench_cleanup(table_id, order_id)
+
+        print(f"{'ruta':<10}{'operación':<12}{'CPU ms/pet.':>14}{'sentencias':>12}")
+        for mode, result in results.items():
+            for name, (cpu_ms, statement_count) in result.items():
+                print(f"{mode:<10}{name:<12}{cpu_ms:>14.3f}{statement_count:>12.1f}")
+        for name in ('add', 'remove'):
+            before, after = results['ORM'][name][0], results['rápida'][name][0]
+            print(f"{name}: {100 * (before - after) / before:.0f}% menos CPU por petición")
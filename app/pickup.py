@@ -0,0 +1,136 @@
+# Archivo: app/pickup.py
+import hashlib
+import json
+from contextlib import contextmanager
+from flask import Blueprint, Response, abort, g, render_template, request
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from . import branch_router
+from .cache import cache_versions, mark_dirty
+from .models import Order
+from .streams import StreamMessage, StreamSource, source, stream_response, stream_view
+
+pickup_bp = Blueprint('pickup', __name__)
+
+PICKUP_STATUSES = ('Pendiente', 'Listo')
+# Cache-Control de la respuesta JSON: las pantallas vuelven a preguntar cada pocos segundos
+BOARD_MAX_AGE = 5
+PICKUP = cache_versions.register('pickup')
+
+
+@contextmanager
+def _reporting(branch):
+    """Consultas de la sucursal por la conexión de solo lectura de reportes."""
+    previous = g.get('reporting', False)
+    with branch_router.use(branch):
+        g.reporting = True
+        try:
+            yield
+        finally:
+            g.reporting = previous
+
+
+class PickupBoard:
+    """Instantánea en memoria del tablero de retiro, una por sucursal.
+
+    Se regenera solo cuando cambia la versión 'pickup' de la sucursal, es decir,
+    cuando algún worker confirma un cambio de estado (o de nombre) en un pedido
+    para llevar; las pantallas que consultan el tablero no tocan la base.
+    """
+
+    def __init__(self):
+        self._snapshots = {}
+
+    def get(self, branch):
+        version = cache_versions.get(PICKUP, branch)
+        snapshot = self._snapshots.get(branch)
+        if snapshot is None or snapshot['version'] != version:
+            snapshot = self._snapshots[branch] = self._build(branch, version)
+        return snapshot
+
+    def clear(self):
+        self._snapshots.clear()
+
+    def _build(self, branch, version):
+        # El tráfico del público va a la conexión de reportes y no compite con los mozos
+        with _reporting(branch):
+            orders = Order.query.filter(Order.type == 'Para Llevar', Order.status.in_(PICKUP_STATUSES))\
+                .order_by(Order.id).all()
+
+        board = {
+            'branch': branch,
+            'preparing': [{'number': o.id, 'name': o.customer_name} for o in orders if o.status == 'Pendiente'],
+            'ready': [{'number': o.id, 'name': o.customer_name} for o in orders if o.status == 'Listo'],
+        }
+        body = json.dumps(board, ensure_ascii=False)
+        return {
+            'board': board,
+            'body': body.encode('utf-8'),
+            'etag': hashlib.sha1(body.encode('utf-8')).hexdigest(),
+            'version': version,
+        }
+
+
+pickup_board = PickupBoard()
+
+
+@source('pickup')
+class PickupSource(StreamSource):
+    def version(self):
+        return cache_versions.get(PICKUP, self.branch)
+
+    def build(self, version):
+        return StreamMessage(version, 'board', pickup_board.get(self.branch)['body'].decode('utf-8'))
+
+
+def _touches_pickup(session):
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, Order) and obj.type == 'Para Llevar':
+            return True
+    for obj in session.dirty:
+        if isinstance(obj, Order) and obj.type == 'Para Llevar':
+            state = inspect(obj)
+            if state.attrs.status.history.has_changes() or state.attrs.customer_name.history.has_changes():
+                return True
+    return False
+
+
+@event.listens_for(Session, 'before_flush')
+def _mark_pickup_dirty(session, flush_context, instances):
+    if _touches_pickup(session):
+        mark_dirty(session, PICKUP)
+
+
+def _branch_or_404(branch):
+    branch = branch or branch_router.default
+    if branch not in branch_router.branches:
+        abort(404)
+    return branch
+
+
+@pickup_bp.route('/pickup')
+@pickup_bp.route('/pickup/<branch>')
+def board_view(branch=None):
+    # Página pública para la pantalla del mostrador; se actualiza sola consultando board_json
+    branch = _branch_or_404(branch)
+    return render_template('pickup/board.html', branch=branch, branch_name=branch_router.branches[branch],
+                           board=pickup_board.get(branch)['board'], max_age=BOARD_MAX_AGE)
+
+
+@pickup_bp.route('/pickup.json')
+@pickup_bp.route('/pickup/<branch>.json')
+def board_json(branch=None):
+    snapshot = pickup_board.get(_branch_or_404(branch))
+    response = Response(snapshot['body'], mimetype='application/json')
+    response.set_etag(snapshot['etag'])
+    response.cache_control.public = True
+    response.cache_control.max_age = BOARD_MAX_AGE
+    return response.make_conditional(request)
+
+
+@pickup_bp.route('/pickup/stream')
+@pickup_bp.route('/pickup/<branch>/stream')
+@stream_view
+def board_stream(branch=None):
+    # Las pantallas reciben el tablero en cuanto cambia (en WSGI, cada STREAM_RETRY_MS)
+    return stream_response('pickup', _branch_or_404(branch))
@@ -0,0 +1,239 @@
+# Archivo: app/printing.py
+import json
+import os
+from datetime import datetime, timedelta
+import click
+from flask import current_app, g
+from sqlalchemy import update
+from . import db
+from .models import Job, Order, load_items_with_products
+from .jobs import task, enqueue, job_values, run_worker, JOB_PENDING, JOB_DONE
+
+# Los trabajos de impresión van a una cola propia: solo los toma `flask spooler`,
+# que corre en la máquina que tiene las impresoras conectadas.
+PRINTER_QUEUE = 'printer'
+
+# Estaciones de impresión: comandas a cocina y barra, tickets de cobro a caja
+KITCHEN, BAR, CASHIER = 'cocina', 'barra', 'caja'
+STATIONS = (KITCHEN, BAR, CASHIER)
+BAR_PRODUCT_TYPES = {'Bebidas con Alcohol', 'Bebidas sin Alcohol'}
+
+# Ítems agregados al mismo pedido dentro de esta ventana salen en una sola comanda
+BATCH_WINDOW = timedelta(seconds=4)
+PRINT_RETRIES = 5
+TICKET_WIDTH = 42
+
+# Comandos ESC/POS
+ESC_INIT = b'\x1b@'
+ESC_CODEPAGE_PC850 = b'\x1bt\x02'
+ESC_BOLD_ON, ESC_BOLD_OFF = b'\x1bE\x01', b'\x1bE\x00'
+ESC_DOUBLE_ON, ESC_DOUBLE_OFF = b'\x1d!\x11', b'\x1d!\x00'
+GS_FEED_AND_CUT = b'\x1dVB\x03'
+
+
+class DirectoryPrinter:
+    """Impresora de prueba: cada ticket queda como archivo en un directorio.
+
+    Escribe los bytes ESC/POS (.prn) y una copia en texto (.txt) para leerla sin
+    impresora. El .prn se puede mandar después a una impresora real con `cat`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def print_ticket(self, name, text, data):
+        os.makedirs(self.path, exist_ok=True)
+        base = os.path.join(self.path, f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}_{name}")
+        for extension, content in (('.txt', text.encode('utf-8')), ('.prn', data)):
+            # Escritura atómica: quien vigile el directorio nunca ve un archivo a medias
+            with open(base + extension + '.tmp', 'wb') as f:
+                f.write(content)
+            os.replace(base + extension + '.tmp', base + extension)
+
+
+class DevicePrinter:
+    """Impresora conectada como dispositivo (p. ej. /dev/usb/lp0) o cola de red montada."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def print_ticket(self, name, text, data):
+        with open(self.path, 'wb') as device:
+            device.write(data)
+            device.flush()
+
+
+def printer_target(station, app=None):
+    app = app or current_app
+    return app.config['PRINTER_TARGETS'][station]
+
+
+def get_printer(station):
+    """PRINTER_<ESTACION> apunta a un dispositivo; un directorio (o una ruta terminada en /) usa DirectoryPrinter."""
+    target = printer_target(station)
+    if target.endswith(os.sep) or os.path.isdir(target):
+        return DirectoryPrinter(target)
+    return DevicePrinter(target)
+
+
+def station_for(product):
+    return BAR if product.type in BAR_PRODUCT_TYPES else KITCHEN
+
+
+def label_for(order_type, table_number, customer_name):
+    if order_type == 'Mesa':
+        return f"Mesa {table_number}" if table_number is not None else 'Mesa'
+    return f"Llevar: {customer_name or '-'}"
+
+
+def order_label(order):
+    return label_for(order.type, order.table_assigned.number if order.table_assigned else None, order.customer_name)
+
+
+# --- Renderizado ---
+
+def _row(left, right):
+    space = max(TICKET_WIDTH - len(left) - len(right), 1)
+    return f'{left}{" " * space}{right}'
+
+
+def render_comanda(station, label, lines, order_id):
+    text = [f'COMANDA {station.upper()}', label, f'Pedido #{order_id}  {datetime.now().strftime("%d/%m %H:%M")}', '-' * TICKET_WIDTH]
+    for line in lines:
+        text.append(f"{line['quantity']:>3} x {line['product']}")
+    text.append('-' * TICKET_WIDTH)
+    return '\n'.join(text) + '\n'
+
+
+def render_receipt(order):
+    text = ['Bar App', order_label(order), f'Pedido #{order.id}  {datetime.now().strftime("%d/%m/%Y %H:%M")}', '-' * TICKET_WIDTH]
+    for item in order.items:
+        text.append(_row(f"{item.quantity} x {item.product.name if item.product else 'Producto'}"[:TICKET_WIDTH - 12], f'${item.subtotal:,.2f}'))
+    text.append('-' * TICKET_WIDTH)
+    text.append(_row('TOTAL', f'${order.total_amount or 0:,.2f}'))
+    text.append(_row('Pago', order.payment_method or '-'))
+    text.append('')
+    text.append('Gracias por su visita')
+    return '\n'.join(text) + '\n'
+
+
+def to_escpos(text):
+    """Convierte el texto de un ticket en bytes ESC/POS: título en doble tamaño y corte al final."""
+    title, _, body = text.partition('\n')
+    return (ESC_INIT + ESC_CODEPAGE_PC850
+            + ESC_BOLD_ON + ESC_DOUBLE_ON + title.encode('cp850', errors='replace') + b'\n' + ESC_DOUBLE_OFF + ESC_BOLD_OFF
+            + body.encode('cp850', errors='replace') + b'\n\n\n' + GS_FEED_AND_CUT)
+
+
+def send_to_printer(station, name, text):
+    get_printer(station).print_ticket(name, text, to_escpos(text))
+
+
+# --- Encolado desde las rutas (sin confirmar: va en la transacción del pedido) ---
+
+def _comanda(order_id, label, product, quantity):
+    return {'order_id': order_id, 'label': label,
+            'lines': [{'station': station_for(product), 'product': product.name, 'quantity': quantity}]}
+
+
+def queue_comanda(order, product, quantity):
+    return enqueue('print_comanda', commit=False, delay=BATCH_WINDOW, **_comanda(order.id, order_label(order), product, quantity))
+
+
+def comanda_job_values(order_id, label, product, quantity):
+    """Igual que queue_comanda, pero como columnas para insertar el trabajo con Core."""
+    return job_values('print_comanda', delay=BATCH_WINDOW, **_comanda(order_id, label, product, quantity))
+
+
+def queue_receipt(order):
+    return enqueue('print_receipt', commit=False, order_id=order.id)
+
+
+# --- Tareas del spooler ---
+
+def _merge_pending_comandas(job):
+    """Suma a este trabajo las líneas de otras comandas pendientes del mismo pedido.
+
+    Cada comanda absorbida se marca como completada con un reclamo condicional, y
+    las líneas quedan guardadas en el payload de este trabajo antes de imprimir,
+    así un reintento vuelve a imprimir el lote completo.
+    """
+    payload = json.loads(job.payload)
+    siblings = Job.query.filter(Job.name == 'print_comanda', Job.status == JOB_PENDING, Job.id != job.id).order_by(Job.id).all()
+    for sibling in siblings:
+        sibling_payload = json.loads(sibling.payload)
+        if sibling_payload.get('order_id') != payload['order_id']:
+            continue
+        claimed = db.session.execute(
+            update(Job).where(Job.id == sibling.id, Job.status == JOB_PENDING)
+            .values(status=JOB_DONE, finished_at=datetime.utcnow(), result=json.dumps({'merged_into': job.id}))
+        )
+        if claimed.rowcount == 1:
+            payload['lines'].extend(sibling_payload['lines'])
+            payload['label'] = sibling_payload.get('label', payload['label'])
+    job.payload = json.dumps(payload)
+    db.session.commit()
+    return payload
+
+
+@task('print_comanda', queue=PRINTER_QUEUE, retries=PRINT_RETRIES)
+def print_comanda(order_id, label, lines, printed=None):
+    """Imprime la comanda en cada estación.
+
+    `printed` son las estaciones que ya salieron en un intento anterior: la tarea
+    las guarda en su payload y run_job se las pasa al reintentar.
+    """
+    job = db.session.get(Job, g.job_id)
+    payload = json.loads(job.payload)
+    printed = list(printed or [])
+    # Solo se agrupa antes de imprimir algo; en un reintento parcial las líneas
+    # nuevas quedarían marcadas como impresas en una estación que ya salió.
+    if not printed:
+        payload = _merge_pending_comandas(job)
+
+    by_station = {}
+    for line in payload['lines']:
+        by_station.setdefault(line['station'], []).append(line)
+    for station, station_lines in by_station.items():
+        if station in printed:
+            continue
+        send_to_printer(station, f'comanda_{order_id}_{station}', render_comanda(station, payload['label'], station_lines, order_id))
+        # Si la otra estación falla, el reintento no repite lo que ya salió impreso
+        printed.append(station)
+        payload['printed'] = printed
+        job.payload = json.dumps(payload)
+        db.session.commit()
+    return {'lines': len(payload['lines']), 'stations': printed}
+
+
+@task('print_receipt', queue=PRINTER_QUEUE, retries=PRINT_RETRIES)
+def print_receipt(order_id):
+    order = Order.query.options(load_items_with_products()).filter_by(id=order_id).first()
+    if order is None:
+        return {'skipped': 'pedido eliminado'}
+    text = render_receipt(order)
+    # No retener la transacción de lectura mientras se espera a la impresora
+    db.session.commit()
+    send_to_printer(CASHIER, f'recibo_{order_id}', text)
+    return {'items': len(order.items)}
+
+
+def init_printing(app):
+    spool_dir = os.path.join(app.instance_path, 'spool')
+    app.config['PRINTER_TARGETS'] = {
+        station: os.environ.get(f'PRINTER_{station.upper()}', os.path.join(spool_dir, station) + os.sep)
+        for station in STATIONS
+    }
+
+    @app.cli.command('spooler')
+    @click.option('--poll-interval', default=1.0, show_default=True, help='Segundos entre consultas a la cola.')
+    @click.option('--once', is_flag=True, help='Imprimir lo pendiente y salir.')
+    def spooler_command(poll_interval, once):
+        """Imprime comandas y tickets encolados (cola 'printer')."""
+        for station in STATIONS:
+            print(f"  {station}: {printer_target(station, app)}")
+        try:
+            # Un solo hilo: los tickets de una impresora salen en el orden en que se encolaron
+            run_worker(app, threads=1, poll_interval=poll_interval, once=once, queues=(PRINTER_QUEUE,))
+        except KeyboardInterrupt:
+            print("\nSpooler detenido.")
@@ -0,0 +1,214 @@
+# Archivo: app/profiling.py
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import time
+from datetime import datetime
+from functools import wraps
+from flask import current_app, g, request, has_request_context
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_QUERY_FLAG = '_profile'
+TOP_FUNCTIONS = 25
+
+
+class QueryBudgetExceeded(RuntimeError):
+    """Una vista ejecutó más sentencias SQL que las declaradas con @query_budget."""
+
+
+def query_budget(max_statements):
+    """Declara el máximo de sentencias SQL que puede ejecutar una vista.
+
+    El límite no depende de cuántas filas se muestren: si una plantilla empieza
+    a cargar relaciones fila por fila (N+1), la petición lo supera. Se registra
+    una advertencia y, con SQL_BUDGET_STRICT (activo en modo testing), se lanza
+    QueryBudgetExceeded para que la regresión falle.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            return f(*args, **kwargs)
+        decorated_function.query_budget = max_statements
+        return decorated_function
+    return decorator
+
+
+def profiles_dir(app=None):
+    app = app or current_app
+    return os.path.join(app.instance_path, 'profiles')
+
+
+def _should_profile():
+    explicit = request.headers.get(PROFILE_HEADER) == '1' or request.args.get(PROFILE_QUERY_FLAG) == '1'
+    if explicit:
+        # Solo un administrador puede pedir un perfil a demanda
+        return current_user.is_authenticated and current_user.role == 'admin'
+    rate = current_app.config['PROFILE_SAMPLE_RATE']
+    return rate > 0 and random.random() < rate
+
+
+def _top_functions(profiler, limit=TOP_FUNCTIONS):
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    rows = []
+    for (filename, line, name), (cc, nc, tt, ct, callers) in stats.stats.items():
+        rows.append({
+            'function': f'{name} ({os.path.basename(filename)}:{line})',
+            'calls': nc,
+            'total_ms': round(tt * 1000, 3),
+            'cumulative_ms': round(ct * 1000, 3),
+        })
+    rows.sort(key=lambda row: row['cumulative_ms'], reverse=True)
+    return rows[:limit]
+
+
+def _save_profile(profiler, response, elapsed_ms):
+    directory = profiles_dir()
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')
+    name = f"{stamp}_{request.method}_{(request.endpoint or 'unknown').replace('.', '-')}"
+
+    profiler.dump_stats(os.path.join(directory, f'{name}.prof'))
+    queries = g.profile_sql
+    metadata = {
+        'name': name,
+        'created_at': datetime.utcnow().isoformat(),
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'duration_ms': round(elapsed_ms, 3),
+        'user': current_user.username if current_user.is_authenticated else None,
+        'sql_count': len(queries),
+        'sql_ms': round(sum(q['ms'] for q in queries), 3),
+        'queries': queries,
+        'top_functions': _top_functions(profiler),
+    }
+    with open(os.path.join(directory, f'{name}.json'), 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, indent=1)
+    _prune(directory, current_app.config['PROFILE_KEEP'])
+
+
+def _prune(directory, keep):
+    sidecars = sorted(f for f in os.listdir(directory) if f.endswith('.json'))
+    for filename in sidecars[:-keep] if keep else []:
+        base = filename[:-len('.json')]
+        for extension in ('.json', '.prof'):
+            try:
+                os.remove(os.path.join(directory, base + extension))
+            except OSError:
+                pass
+
+
+def list_profiles(limit=100):
+    directory = profiles_dir()
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for filename in sorted((f for f in os.listdir(directory) if f.endswith('.json')), reverse=True)[:limit]:
+        profile = load_profile(filename[:-len('.json')])
+        if profile:
+            profiles.append(profile)
+    return profiles
+
+
+def load_profile(name):
+    if os.sep in name or name.startswith('.'):
+        return None
+    try:
+        with open(os.path.join(profiles_dir(), f'{name}.json'), encoding='utf-8') as f:
+            profile = json.load(f)
+    except (OSError, ValueError):
+        return None
+    profile['slowest_queries'] = sorted(profile['queries'], key=lambda q: q['ms'], reverse=True)
+    return profile
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context():
+        return
+    if g.get('sql_count') is not None:
+        g.sql_count += 1
+    if g.get('profile_sql') is not None:
+        conn.info.setdefault('profile_query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and g.get('profile_sql') is not None:
+        started = conn.info['profile_query_start'].pop()
+        g.profile_sql.append({
+            'sql': statement,
+            'params': repr(parameters)[:300],
+            'ms': round((time.perf_counter() - started) * 1000, 3),
+        })
+
+
+def init_profiling(app):
+    app.config.setdefault('PROFILE_SAMPLE_RATE', float(os.environ.get('PROFILE_SAMPLE_RATE', '0')))
+    app.config.setdefault('PROFILE_KEEP', int(os.environ.get('PROFILE_KEEP', '200')))
+    app.config.setdefault('SQL_BUDGET_STRICT', os.environ.get('SQL_BUDGET_STRICT') == '1')
+
+    @app.before_request
+    def start_query_budget():
+        view = app.view_functions.get(request.endpoint)
+        budget = getattr(view, 'query_budget', None)
+        if budget is not None:
+            g.sql_budget = budget
+            g.sql_count = 0
+
+    @app.after_request
+    def check_query_budget(response):
+        budget = g.pop('sql_budget', None)
+        if budget is None:
+            return response
+        count = g.pop('sql_count')
+        response.headers['X-SQL-Statements'] = str(count)
+        if count > budget:
+            message = f"{request.endpoint} ejecutó {count} sentencias SQL (presupuesto: {budget})."
+            if app.config['SQL_BUDGET_STRICT'] or app.testing:
+                raise QueryBudgetExceeded(message)
+            app.logger.warning(message)
+        return response
+
+    @app.before_request
+    def start_profiler():
+        if request.endpoint in ('static', 'assets') or not _should_profile():
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+: ya hay otro perfilador activo en el proceso
+            return
+        g.profiler = profiler
+        g.profile_sql = []
+        g.profile_started = time.perf_counter()
+
+    @app.after_request
+    def stop_profiler(response):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return response
+        profiler.disable()
+        elapsed_ms = (time.perf_counter() - g.profile_started) * 1000
+        try:
+            _save_profile(profiler, response, elapsed_ms)
+        except OSError:
+            app.logger.exception("No se pudo guardar el perfil de la petición.")
+        g.profile_sql = None
+        response.headers['X-Profile-Duration-Ms'] = f'{elapsed_ms:.1f}'
+        return response
+
+    @app.teardown_request
+    def discard_profiler(exc):
+        # Si la petición terminó sin pasar por after_request, no dejar el perfilador activo
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
@@ -0,0 +1,69 @@
+# Archivo: app/reporting.py
+import os
+from functools import wraps
+from flask import g
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from .branches import bind_key, report_key
+
+
+def readonly_uri(uri):
+    """Convierte una URI SQLite en su variante de solo lectura (mode=ro).
+
+    Devuelve None para motores que no son SQLite: en ese caso hay que configurar
+    una réplica explícita con REPORTING_DATABASE_URI.
+    """
+    url = make_url(uri)
+    if url.get_backend_name() != 'sqlite' or not url.database or url.database == ':memory:':
+        return None
+    return f'sqlite:///file:{url.database}?mode=ro&uri=true'
+
+
+def configure_reporting_binds(app):
+    """Registra un bind de solo lectura por sucursal. Debe llamarse antes de db.init_app."""
+    branches = app.config['BRANCHES']
+    default = app.config['DEFAULT_BRANCH']
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    for code in branches:
+        if code == default:
+            uri = os.environ.get('REPORTING_DATABASE_URI') or readonly_uri(app.config['SQLALCHEMY_DATABASE_URI'])
+        else:
+            uri = readonly_uri(binds[bind_key(code)])
+        if uri:
+            binds[report_key(code)] = uri
+    app.config['SQLALCHEMY_BINDS'] = binds
+
+
+def _set_sqlite_pragmas(readonly):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if readonly:
+            cursor.execute('PRAGMA query_only=ON')
+        else:
+            # WAL: los lectores (reportes) no bloquean a los escritores ni viceversa
+            cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.close()
+    return on_connect
+
+
+def init_reporting(app, db):
+    """Activa WAL en los motores de escritura SQLite y query_only en los de reportes."""
+    with app.app_context():
+        for key, engine in db.engines.items():
+            if engine.dialect.name != 'sqlite':
+                continue
+            readonly = key is not None and key.startswith(report_key(''))
+            event.listen(engine, 'connect', _set_sqlite_pragmas(readonly))
+
+
+def reporting_view(f):
+    """Envía todas las consultas de la vista a la conexión de solo lectura de reportes."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        g.reporting = True
+        try:
+            return f(*args, **kwargs)
+        finally:
+            g.reporting = False
+    return decorated_function
@@ -0,0 +1,224 @@
+# Archivo: app/streams.py
+import asyncio
+import json
+import os
+import statistics
+import time
+from collections import namedtuple
+from urllib.parse import urlsplit
+import click
+from flask import Response, current_app, request
+
+# Cabecera interna con la que una vista le pasa el stream al servidor ASGI (ver asgi.py);
+# el servidor la quita antes de responder.
+HANDOFF_HEADER = 'X-Stream-Handoff'
+# Marca que agrega asgi.py al environ de las vistas marcadas con @stream_view:
+# el servidor puede mantener el stream abierto en el event loop
+ASYNC_STREAMS_KEY = 'bar.async_streams'
+
+StreamMessage = namedtuple('StreamMessage', 'id event data')
+
+SOURCES = {}
+
+
+def source(name):
+    """Registra una clase de origen de stream bajo `name`."""
+    def decorator(cls):
+        SOURCES[name] = cls
+        return cls
+    return decorator
+
+
+class StreamSource:
+    """Origen de los mensajes de un stream para una sucursal.
+
+    poll() corre con el contexto de aplicación y la sucursal ya activos y devuelve
+    el estado completo como StreamMessage solo si cambió desde la última llamada
+    (None si no cambió). Cada mensaje lleva el estado entero, así que a un cliente
+    que se conecta tarde le alcanza con el último.
+    """
+
+    def __init__(self, branch, last_id=None):
+        self.branch = branch
+        self.last_id = last_id
+
+    def version(self):
+        raise NotImplementedError
+
+    def build(self, version):
+        raise NotImplementedError
+
+    def poll(self):
+        version = self.version()
+        if str(version) == self.last_id:
+            return None
+        self.last_id = str(version)
+        return self.build(version)
+
+
+def stream_view(f):
+    """Marca una vista que responde con stream_response(); va justo encima de la función."""
+    f.stream = True
+    return f
+
+
+def format_message(message):
+    return f'id: {message.id}\nevent: {message.event}\ndata: {message.data}\n\n'.encode('utf-8')
+
+
+def retry_line(app):
+    return f"retry: {app.config['STREAM_RETRY_MS']}\n\n".encode('utf-8')
+
+
+def stream_response(name, branch):
+    """Respuesta text/event-stream para el origen `name` de la sucursal.
+
+    Con el servidor ASGI la conexión queda abierta en el event loop y recibe cada
+    cambio. Con WSGI no se retiene el worker: se envía el estado actual (si cambió
+    respecto del Last-Event-ID del cliente) y se cierra; EventSource se reconecta
+    solo después de STREAM_RETRY_MS, como un sondeo.
+    """
+    if name not in SOURCES:
+        raise KeyError(f"Stream desconocido: {name}")
+    last_id = request.headers.get('Last-Event-ID')
+    if request.environ.get(ASYNC_STREAMS_KEY):
+        response = Response(status=200, mimetype='text/event-stream')
+        response.headers[HANDOFF_HEADER] = json.dumps({'stream': name, 'branch': branch, 'last_id': last_id})
+    else:
+        message = SOURCES[name](branch, last_id).poll()
+        body = retry_line(current_app) + (format_message(message) if message else b'')
+        response = Response(body, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Que un nginx delante no acumule el stream en su buffer
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def _http_get(host, port, target, read_body=True):
+    reader, writer = await asyncio.open_connection(host, port)
+    headers = [f'GET {target} HTTP/1.1', f'Host: {host}:{port}', 'Accept-Encoding: identity']
+    headers += ['Connection: close'] if read_body else ['Accept: text/event-stream']
+    writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode('latin-1'))
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    if read_body:
+        await reader.read()
+        writer.close()
+        return status, None, None
+    return status, reader, writer
+
+
+async def _measure(host, port, paths, count, concurrency):
+    latencies, errors = [], 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(path):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                status, _, _ = await asyncio.wait_for(_http_get(host, port, path), 30)
+            except (OSError, asyncio.TimeoutError, IndexError, ValueError):
+                errors += 1
+                return
+            if status >= 500:
+                errors += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    await asyncio.gather(*(one(paths[i % len(paths)]) for i in range(count)))
+    return latencies, errors
+
+
+def _summary(latencies):
+    if not latencies:
+        return 'sin respuestas'
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    return f'p50 {statistics.median(latencies):.1f} ms, p95 {p95:.1f} ms, máx {latencies[-1]:.1f} ms'
+
+
+async def _bench(url, streams, stream_path, paths, count, concurrency, hold):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    baseline, baseline_errors = await _measure(host, port, paths, count, concurrency)
+
+    opened, first_event, failed = [], [0], [0]
+
+    async def open_stream():
+        try:
+            status, reader, writer = await asyncio.wait_for(_http_get(host, port, stream_path, read_body=False), 30)
+        except (OSError, asyncio.TimeoutError, IndexError, ValueError):
+            failed[0] += 1
+            return
+        if status != 200:
+            failed[0] += 1
+            writer.close()
+            return
+        opened.append(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.startswith(b'data:'):
+                    first_event[0] += 1
+                    break
+            # El resto del tiempo la conexión queda abierta y ociosa
+            while await reader.read(4096):
+                pass
+        except (OSError, asyncio.CancelledError):
+            pass
+        # Como EventSource, se cierra el lado propio cuando el servidor termina el stream
+        writer.close()
+
+    start = time.perf_counter()
+    tasks = [asyncio.ensure_future(open_stream()) for _ in range(streams)]
+    await asyncio.sleep(0)
+    while len(opened) + failed[0] < streams and time.perf_counter() - start < 30:
+        await asyncio.sleep(0.05)
+    open_seconds = time.perf_counter() - start
+    await asyncio.sleep(hold)
+    loaded, loaded_errors = await _measure(host, port, paths, count, concurrency)
+    # Las tareas de los streams terminan cuando el servidor cierra la conexión
+    still_open = sum(1 for task in tasks if not task.done())
+
+    for writer in opened:
+        writer.close()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return {
+        'baseline': baseline, 'baseline_errors': baseline_errors, 'loaded': loaded, 'loaded_errors': loaded_errors,
+        'opened': len(opened), 'failed': failed[0], 'first_event': first_event[0], 'still_open': still_open,
+        'open_seconds': open_seconds,
+    }
+
+
+def init_streams(app):
+    # Intervalo con el que cada sucursal consulta si cambió algo, compartido por todas las conexiones
+    app.config.setdefault('STREAM_POLL_INTERVAL', float(os.environ.get('STREAM_POLL_INTERVAL', '0.5')))
+    # Comentario periódico para que proxies y balanceadores no corten la conexión ociosa
+    app.config.setdefault('STREAM_HEARTBEAT', float(os.environ.get('STREAM_HEARTBEAT', '15')))
+    # Espera antes de reconectar (en WSGI, es el intervalo de sondeo de las pantallas)
+    app.config.setdefault('STREAM_RETRY_MS', int(os.environ.get('STREAM_RETRY_MS', '5000')))
+
+    @app.cli.command('bench-streams')
+    @click.option('--url', default='http://127.0.0.1:8000', show_default=True, help='Servidor ya levantado.')
+    @click.option('--streams', default=300, show_default=True, help='Conexiones de stream ociosas a abrir.')
+    @click.option('--stream-path', default='/pickup/stream', show_default=True)
+    @click.option('--path', 'paths', multiple=True, help='Rutas medidas (por defecto /auth/login y /pickup.json).')
+    @click.option('--requests', 'count', default=200, show_default=True, help='Peticiones medidas en cada fase.')
+    @click.option('--concurrency', default=4, show_default=True)
+    @click.option('--hold', default=2.0, show_default=True, help='Segundos con los streams abiertos antes de medir.')
+    def bench_streams_command(url, streams, stream_path, paths, count, concurrency, hold):
+        """Mide la latencia de peticiones normales sin streams y con cientos de streams ociosos abiertos.
+
+        Hay que levantar antes el servidor (uvicorn asgi:app o gunicorn wsgi:app)
+        y, si se abren muchos streams, subir el límite de archivos abiertos (ulimit -n).
+        """
+        paths = list(paths) or ['/auth/login', '/pickup.json']
+        result = asyncio.run(_bench(url, streams, stream_path, paths, count, concurrency, hold))
+        print(f"Sin streams:  {_summary(result['baseline'])} ({result['baseline_errors']} errores)")
+        print(f"Streams: {result['opened']} abiertos en {result['open_seconds']:.2f} s, {result['failed']} fallidos, "
+              f"{result['first_event']} con estado inicial, {result['still_open']} abiertos al medir")
+        print(f"Con streams:  {_summary(result['loaded'])} ({result['loaded_errors']} errores)")
@@ -0,0 +1,78 @@
+# Archivo: app/warmup.py
+import time
+from datetime import datetime
+from flask import Blueprint, current_app, jsonify
+from sqlalchemy import text
+from sqlalchemy.orm import configure_mappers
+from . import db, branch_router
+
+health_bp = Blueprint('health', __name__)
+
+
+def _warmup_status(app):
+    return app.extensions.setdefault('warmup', {
+        'ready': False, 'started_at': None, 'finished_at': None, 'steps': {}, 'error': None
+    })
+
+
+def _timed(status, name, func):
+    start = time.perf_counter()
+    func()
+    status['steps'][name] = round((time.perf_counter() - start) * 1000, 1)
+
+
+def _prime_branch_data():
+    from .models import Table, Order
+    from .mozo import render_product_picker
+    for code in branch_router.branches:
+        with branch_router.use(code):
+            # Selector de productos en la caché de fragmentos y páginas de la base en memoria
+            render_product_picker()
+            Table.query.order_by(Table.number).all()
+            Order.query.filter(Order.status.in_(['Activo', 'Pendiente'])).all()
+            db.session.remove()
+
+
+def warmup(app):
+    """Prepara el proceso antes de aceptar tráfico.
+
+    Con `gunicorn --preload` se ejecuta una sola vez en el proceso maestro y los
+    workers heredan mappers configurados, plantillas compiladas y cachés cargadas.
+    """
+    status = _warmup_status(app)
+    status.update(ready=False, started_at=datetime.utcnow().isoformat(), error=None)
+    try:
+        _timed(status, 'mappers', configure_mappers)
+        _timed(status, 'templates', lambda: [app.jinja_env.get_template(name) for name in app.jinja_env.list_templates()])
+        with app.app_context():
+            _timed(status, 'catalogue_and_floor', _prime_branch_data)
+    except Exception as e:
+        status['error'] = f'{type(e).__name__}: {e}'
+        app.logger.exception("Falló el warmup de la aplicación.")
+        return status
+    status.update(ready=True, finished_at=datetime.utcnow().isoformat())
+    app.logger.info("Warmup completo: %s", status['steps'])
+    return status
+
+
+@health_bp.route('/healthz')
+def healthz():
+    # Liveness: el proceso responde. No toca la base de datos.
+    return jsonify({'status': 'ok'})
+
+
+@health_bp.route('/readyz')
+def readyz():
+    # Readiness: warmup terminado y la base de datos de cada sucursal accesible
+    status = _warmup_status(current_app)
+    databases = {}
+    for code in branch_router.branches:
+        try:
+            with branch_router.engine(code).connect() as connection:
+                connection.execute(text('SELECT 1'))
+            databases[code] = 'ok'
+        except Exception as e:
+            databases[code] = f'error: {type(e).__name__}'
+    ready = status['ready'] and all(state == 'ok' for state in databases.values())
+    body = {'ready': ready, 'warmup': status, 'databases': databases}
+    return jsonify(body), 200 if ready else 503
@@ -0,0 +1,11 @@
+# Archivo: asgi.py
+# Modo ASGI, para pantallas con streams abiertos (tablero de retiro, vista de mesas):
+#   uvicorn asgi:app --host 0.0.0.0 --port 8000
+# Las vistas de Flask corren igual que con wsgi.py; solo los streams viven en el event loop.
+from app import create_app
+from app.asgi import AsgiServer
+from app.warmup import warmup
+
+flask_app = create_app()
+warmup(flask_app)
+app = AsgiServer(flask_app)
@@ -0,0 +1,93 @@
+// Archivo: assets/build-css.mjs
+// Compila la entrada de Tailwind con la API de `tailwindcss` (la única dependencia de npm):
+//   node assets/build-css.mjs ./assets/app.css ./build/app.css
+// Hace lo mismo que el CLI de Tailwind: resuelve @import/@config, busca las clases
+// usadas en los archivos de @source y del `content` de la config, y escribe el CSS minificado.
+import { mkdir, readFile, readdir, writeFile } from 'node:fs/promises';
+import { createRequire } from 'node:module';
+import path from 'node:path';
+import { compile } from 'tailwindcss';
+
+const require = createRequire(import.meta.url);
+const SCANNED_EXTENSIONS = new Set(['.html', '.htm', '.jinja', '.js', '.mjs', '.py']);
+// Igual que el extractor de Tailwind: todo lo que no sean espacios, comillas ni delimitadores de HTML/Jinja
+const CANDIDATE_RE = /[^\s"'`<>{}]+/g;
+
+async function loadStylesheet(id, base) {
+  const file = id.startsWith('.') ? path.resolve(base, id) : require.resolve(id === 'tailwindcss' ? 'tailwindcss/index.css' : id, { paths: [base] });
+  return { path: file, base: path.dirname(file), content: await readFile(file, 'utf8') };
+}
+
+async function loadModule(id, base) {
+  const file = id.startsWith('.') ? path.resolve(base, id) : require.resolve(id, { paths: [base] });
+  return { path: file, base: path.dirname(file), module: require(file) };
+}
+
+async function* walk(dir) {
+  let entries;
+  try {
+    entries = await readdir(dir, { withFileTypes: true });
+  } catch {
+    return;
+  }
+  for (const entry of entries) {
+    const full = path.join(dir, entry.name);
+    if (entry.isDirectory()) {
+      if (entry.name !== 'node_modules' && !entry.name.startsWith('.')) yield* walk(full);
+    } else if (SCANNED_EXTENSIONS.has(path.extname(entry.name))) {
+      yield full;
+    }
+  }
+}
+
+async function scan(sources) {
+  const candidates = new Set();
+  for (const { base, pattern, negated } of sources) {
+    if (negated) continue;
+    // Solo importa la parte fija del patrón: se recorre ese directorio entero
+    const fixed = pattern.split('/').filter((part) => !/[*?{[]/.test(part)).join('/');
+    for await (const file of walk(path.resolve(base, fixed))) {
+      for (const token of (await readFile(file, 'utf8')).match(CANDIDATE_RE) || []) {
+        candidates.add(token);
+        candidates.add(token.replace(/[,;.]+$/, ''));
+      }
+    }
+  }
+  return [...candidates];
+}
+
+function minify(css) {
+  // Quita comentarios y espacios sobrantes sin tocar el contenido de las cadenas
+  let out = '';
+  for (let i = 0; i < css.length; i++) {
+    const char = css[i];
+    if (char === '"' || char === "'") {
+      const end = css.indexOf(char, i + 1);
+      const stop = end === -1 ? css.length : end + 1;
+      out += css.slice(i, stop);
+      i = stop - 1;
+    } else if (char === '/' && css[i + 1] === '*') {
+      const end = css.indexOf('*/', i + 2);
+      i = end === -1 ? css.length : end + 1;
+    } else if (/\s/.test(char)) {
+      while (i + 1 < css.length && /\s/.test(css[i + 1])) i++;
+      if (!/[{};,]$/.test(out) && !/[{};,]/.test(css[i + 1] || '')) out += ' ';
+    } else {
+      if (char === '}' && out.endsWith(';')) out = out.slice(0, -1);
+      out += char;
+    }
+  }
+  return out.trim();
+}
+
+const [input, output] = process.argv.slice(2);
+if (!input || !output) {
+  console.error('Uso: node assets/build-css.mjs <entrada.css> <salida.css>');
+  process.exit(2);
+}
+const inputPath = path.resolve(input);
+const base = path.dirname(inputPath);
+const compiler = await compile(await readFile(inputPath, 'utf8'), { base, from: inputPath, loadStylesheet, loadModule });
+const css = compiler.build(await scan(compiler.sources));
+await mkdir(path.dirname(path.resolve(output)), { recursive: true });
+await writeFile(output, minify(css));
@@ -0,0 +1,21 @@
+# Archivo: gunicorn.conf.py
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', '3'))
+# Con preload, wsgi.py (y su warmup) se ejecuta una vez en el maestro antes de crear los workers
+preload_app = True
+
+
+def post_fork(server, worker):
+    # Las conexiones abiertas durante el warmup no se deben compartir entre procesos
+    from app import db
+    # Con -k uvicorn.workers.UvicornWorker asgi:app, la aplicación cargada envuelve a la de Flask
+    loaded = server.app.wsgi()
+    app = getattr(loaded, 'flask_app', loaded)
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    # Ídem para las conexiones con las que se leen las versiones de las cachés
+    from app.cache import cache_versions
+    cache_versions.backend.reset()
@@ -16,6 +16,10 @@ logger = logging.getLogger('alembic.env')
 
 
 def get_engine():
+    # Con varias sucursales se migra la base de datos de la sucursal activa
+    branches = current_app.extensions.get('branches')
+    if branches is not None:
+        return branches.engine()
     try:
         # this works with Flask-SQLAlchemy<3 and Alchemical
         return current_app.extensions['migrate'].db.get_engine()
@@ -0,0 +1,41 @@
+# Archivo: tests/conftest.py
+import os
+import pytest
+from flask_migrate import upgrade
+from app import create_app, db
+from app.cache import fragment_cache, user_cache
+from app.pickup import pickup_board
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """Aplicación con una sola sucursal sobre una base SQLite temporal, migrada y con los datos de seed-db."""
+    for name in ('BAR_BRANCHES', 'BAR_BRANCH', 'REPORTING_DATABASE_URI', 'PROFILE_SAMPLE_RATE'):
+        monkeypatch.delenv(name, raising=False)
+    app = create_app(instance_path=str(tmp_path))
+    # En modo testing un presupuesto de SQL superado lanza QueryBudgetExceeded
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with app.app_context():
+        upgrade(directory=MIGRATIONS_DIR)
+    result = app.test_cli_runner().invoke(args=['seed-db'])
+    assert result.exit_code == 0, result.output
+
+    # Las cachés en memoria son del proceso: no deben traer entradas de la base de otro test
+    fragment_cache.clear()
+    user_cache.clear()
+    pickup_board.clear()
+    yield app
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    """Cliente con sesión de administrador (puede entrar también a las vistas de mozo)."""
+    client = app.test_client()
+    response = client.post('/auth/login', data={'username': 'admin', 'password': 'admin123'})
+    assert response.status_code == 302
+    return client
@@ -0,0 +1,34 @@
+# Archivo: tests/test_assets.py
+"""Variante comprimida que sirve /assets según el Accept-Encoding (un q=0 la rechaza)."""
+import pytest
+
+ASSET = 'app.0123456789ab.css'
+
+
+@pytest.fixture
+def dist(app, tmp_path):
+    static = tmp_path / 'static'
+    (static / 'dist').mkdir(parents=True)
+    for suffix, content in (('', b'plain'), ('.gz', b'gzip'), ('.br', b'brotli')):
+        (static / 'dist' / (ASSET + suffix)).write_bytes(content)
+    app.static_folder = str(static)
+    return app.test_client()
+
+
+@pytest.mark.parametrize('accept_encoding, encoding', [
+    ('gzip, br', 'br'),
+    ('gzip, br;q=0', 'gzip'),
+    ('br;q=0.0, gzip;q=0.5', 'gzip'),
+    ('*, br;q=0', 'gzip'),
+    ('*;q=0, br', 'br'),
+    ('gzip;q=0, br;q=0', None),
+    ('identity', None),
+    ('', None),
+])
+def test_asset_encoding(dist, accept_encoding, encoding):
+    response = dist.get(f'/assets/{ASSET}', headers={'Accept-Encoding': accept_encoding})
+    assert response.status_code == 200
+    assert response.headers.get('Content-Encoding') == encoding
+    assert response.get_data() == {'br': b'brotli', 'gzip': b'gzip', None: b'plain'}[encoding]
+    assert 'Accept-Encoding' in response.headers['Vary']
+    response.close()
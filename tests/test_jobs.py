@@ -0,0 +1,22 @@
+# Archivo: tests/test_jobs.py
+"""Un trabajo borrado después de reservarlo se omite sin tirar abajo el hilo del worker."""
+import logging
+from app import db, branch_router
+from app.jobs import JOB_RUNNING, enqueue, run_job
+from app.models import Job
+
+
+def test_run_job_skips_deleted_job(app, caplog):
+    with app.app_context():
+        branch = branch_router.current()
+        job = enqueue('print_receipt', order_id=1)
+        job.status = JOB_RUNNING
+        db.session.commit()
+        job_id = job.id
+        # Lo borra, por ejemplo, una restauración entre la reserva y la ejecución
+        db.session.delete(job)
+        db.session.commit()
+
+    with caplog.at_level(logging.WARNING):
+        run_job(app, branch, job_id)
+    assert f'El trabajo {job_id}' in caplog.text
@@ -0,0 +1,90 @@
+# Archivo: tests/test_order_items.py
+"""La ruta rápida de order_items (Core) y la del ORM (ORDER_ITEMS_FAST_PATH=0) dejan las mismas filas.
+
+La ruta rápida no pasa por los eventos de flush del ORM: los movimientos de stock,
+los eventos del pedido, la comanda, la versión y las marcas de caché se escriben a
+mano, así que se comparan contra lo que hace el ORM con la misma secuencia.
+"""
+import json
+import pytest
+from app import db
+from app.cache import CATALOGUE, FLOOR, cache_versions
+from app.models import Job, Order, OrderEvent, OrderItem, StockMovement
+
+# Producto con poco stock (Flan, 40) para el caso de stock insuficiente
+SCARCE_PRODUCT = 9
+
+
+def run_sequence(app, client, table_id, fast):
+    """Abre la mesa, agrega y quita ítems; devuelve las respuestas JSON y el id del pedido."""
+    app.config['ORDER_ITEMS_FAST_PATH'] = fast
+    assert client.post(f'/mozo/table/{table_id}/start_order').status_code in (200, 302)
+    with app.app_context():
+        order_id = Order.query.filter_by(table_id=table_id, status='Activo').one().id
+
+    responses = []
+
+    def post(url, expected=200, **data):
+        response = client.post(url, data=data)
+        assert response.status_code == expected, response.get_data(as_text=True)
+        body = response.get_json()
+        responses.append({key: value for key, value in body.items() if key != 'item'})
+        return body
+
+    post(f'/mozo/order/{order_id}/add_item', product_id=1, quantity=2)
+    post(f'/mozo/order/{order_id}/add_item', product_id=1, quantity=1)
+    second = post(f'/mozo/order/{order_id}/add_item', product_id=3, quantity=3)
+    post(f'/mozo/order/{order_id}/add_item', expected=400, product_id=SCARCE_PRODUCT, quantity=41)
+    post(f'/mozo/order_item/{second["item"]["id"]}/remove')
+    return responses, order_id
+
+
+def snapshot(order_id):
+    order = db.session.get(Order, order_id)
+    items = [(item.product_id, item.quantity, item.unit_price, item.subtotal, item.added_by_id)
+             for item in OrderItem.query.filter_by(order_id=order_id).order_by(OrderItem.product_id)]
+    movements = [(m.product_id, m.kind, m.on_hand_delta, m.reserved_delta, m.user_id, m.note)
+                 for m in StockMovement.query.filter_by(order_id=order_id).order_by(StockMovement.id)]
+    order_events = []
+    for event in OrderEvent.query.filter_by(order_id=order_id).order_by(OrderEvent.id):
+        payload = json.loads(event.payload)
+        # Cada ruta abre una mesa distinta
+        payload.pop('table_id', None)
+        order_events.append((event.event_type, payload))
+    comandas = []
+    for job in Job.query.filter_by(name='print_comanda').order_by(Job.id):
+        payload = json.loads(job.payload)
+        if payload.pop('order_id') == order_id:
+            payload.pop('label')
+            comandas.append((job.status, job.queue, job.run_after is not None, payload))
+    return {'order': (order.status, order.version, order.total_amount), 'items': items, 'movements': movements,
+            'events': order_events, 'comandas': comandas}
+
+
+def cache_marks(app):
+    with app.app_context():
+        return {name: cache_versions.get(name) for name in (CATALOGUE, FLOOR)}
+
+
+@pytest.mark.parametrize('first_fast', [True, False])
+def test_fast_path_matches_orm(app, client, first_fast):
+    results = {}
+    # Cada ruta usa su propia mesa; el orden se alterna para que el stock previo no favorezca a una
+    for table_id, fast in ((1, first_fast), (2, not first_fast)):
+        before = cache_marks(app)
+        responses, order_id = run_sequence(app, client, table_id, fast)
+        after = cache_marks(app)
+        with app.app_context():
+            results[fast] = {
+                'snapshot': snapshot(order_id),
+                'cache': {name: after[name] - before[name] for name in after},
+                'responses': [{key: value for key, value in body.items() if key != 'product_stock'}
+                              for body in responses],
+            }
+
+    fast, orm = results[True], results[False]
+    assert fast['snapshot'] == orm['snapshot']
+    assert fast['responses'] == orm['responses']
+    # Las mismas invalidaciones: cada escritura confirmada sube las versiones que lee el salón y el catálogo
+    assert fast['cache'] == orm['cache']
+    assert fast['snapshot']['items'] and fast['snapshot']['movements'] and fast['snapshot']['events']
@@ -0,0 +1,35 @@
+# Archivo: tests/test_printing.py
+"""Reintento de una comanda: no repite las estaciones que ya salieron impresas."""
+import json
+from app import db, branch_router
+from app.jobs import JOB_DONE, JOB_PENDING, enqueue, run_job
+from app.models import Job
+from app.printing import BAR, KITCHEN
+
+
+def test_retry_skips_printed_stations(app, tmp_path):
+    kitchen, bar = tmp_path / 'cocina', tmp_path / 'barra'
+    # La impresora de barra no está conectada: el dispositivo no existe
+    app.config['PRINTER_TARGETS'].update({KITCHEN: f'{kitchen}/', BAR: str(tmp_path / 'sin-impresora' / 'lp0')})
+    with app.app_context():
+        branch = branch_router.current()
+        job_id = enqueue('print_comanda', order_id=1, label='Mesa 1', lines=[
+            {'station': KITCHEN, 'product': 'Muzzarella', 'quantity': 1},
+            {'station': BAR, 'product': 'Cerveza Lager (1L)', 'quantity': 2},
+        ]).id
+
+    run_job(app, branch, job_id)
+    with app.app_context():
+        job = db.session.get(Job, job_id)
+        assert job.status == JOB_PENDING
+        assert json.loads(job.payload)['printed'] == [KITCHEN]
+    assert len(list(kitchen.glob('*.txt'))) == 1
+
+    app.config['PRINTER_TARGETS'][BAR] = f'{bar}/'
+    run_job(app, branch, job_id)
+    with app.app_context():
+        job = db.session.get(Job, job_id)
+        assert job.status == JOB_DONE
+        assert json.loads(job.result)['stations'] == [KITCHEN, BAR]
+    assert len(list(kitchen.glob('*.txt'))) == 1
+    assert len(list(bar.glob('*.txt'))) == 1
@@ -0,0 +1,118 @@
+# Archivo: tests/test_query_budgets.py
+"""Sentencias SQL por vista: deben respetar el @query_budget y no crecer con la cantidad de filas (N+1)."""
+from datetime import datetime
+from app import db
+from app.models import Order, OrderItem, Product, Table
+
+# Cantidad de pedidos o ítems del segundo paso; seed-db crea 9 productos y 10 mesas
+MANY = 8
+
+
+def statements(app, client, endpoint, url):
+    """Sentencias de la vista con cachés frías y calientes; ambas dentro del presupuesto."""
+    budget = app.view_functions[endpoint].query_budget
+    counts = []
+    for _ in range(2):
+        response = client.get(url)
+        assert response.status_code == 200
+        counts.append(int(response.headers['X-SQL-Statements']))
+    assert max(counts) <= budget, f'{endpoint}: {counts} sentencias, presupuesto {budget}'
+    return counts[-1]
+
+
+def products():
+    return Product.query.order_by(Product.id).all()
+
+
+def add_items(order, count):
+    for product in products()[len(order.items):count]:
+        order.items.append(OrderItem(product=product, quantity=2, unit_price=product.price))
+    order.calculate_total()
+
+
+def new_order(**fields):
+    order = Order(**fields)
+    db.session.add(order)
+    return order
+
+
+def paid_order(table=None):
+    return new_order(type='Mesa' if table else 'Para Llevar', status='Pagado', table_assigned=table,
+                     payment_method='Efectivo', paid_at=datetime.utcnow(), customer_name=None if table else 'Ana')
+
+
+def test_tables_view(app, client):
+    def open_tables(count):
+        with app.app_context():
+            for table in Table.query.order_by(Table.number).limit(count):
+                if table.status == 'Vacía':
+                    table.status = 'Ocupada'
+                    add_items(new_order(type='Mesa', status='Activo', table_assigned=table), 1)
+            db.session.commit()
+
+    open_tables(1)
+    one = statements(app, client, 'mozo.tables_view', '/mozo/tables')
+    open_tables(MANY)
+    assert statements(app, client, 'mozo.tables_view', '/mozo/tables') == one
+
+
+def test_table_detail_view(app, client):
+    with app.app_context():
+        table = Table.query.filter_by(number=1).one()
+        table.status = 'Ocupada'
+        order = new_order(type='Mesa', status='Activo', table_assigned=table)
+        add_items(order, 1)
+        db.session.commit()
+        table_id, order_id = table.id, order.id
+    url = f'/mozo/table/{table_id}'
+    one = statements(app, client, 'mozo.table_detail_view', url)
+
+    with app.app_context():
+        add_items(db.session.get(Order, order_id), MANY)
+        db.session.commit()
+    assert statements(app, client, 'mozo.table_detail_view', url) == one
+
+
+def test_takeaway_order_detail(app, client):
+    with app.app_context():
+        order = new_order(type='Para Llevar', status='Pendiente', customer_name='Ana')
+        add_items(order, 1)
+        db.session.commit()
+        order_id = order.id
+    url = f'/mozo/takeaway/{order_id}'
+    one = statements(app, client, 'mozo.takeaway_order_detail', url)
+
+    with app.app_context():
+        add_items(db.session.get(Order, order_id), MANY)
+        db.session.commit()
+    assert statements(app, client, 'mozo.takeaway_order_detail', url) == one
+
+
+def test_sales_log(app, client):
+    def sell(count):
+        with app.app_context():
+            tables = Table.query.order_by(Table.number).all()
+            for index in range(Order.query.filter_by(status='Pagado').count(), count):
+                # Mitad de mesa (con su mesa cargada en la misma consulta) y mitad para llevar
+                add_items(paid_order(tables[index] if index % 2 == 0 else None), 2)
+            db.session.commit()
+
+    sell(1)
+    one = statements(app, client, 'admin.sales_log', '/admin/sales')
+    sell(MANY)
+    assert statements(app, client, 'admin.sales_log', '/admin/sales') == one
+
+
+def test_sale_detail_view(app, client):
+    with app.app_context():
+        order = paid_order(Table.query.filter_by(number=1).one())
+        add_items(order, 1)
+        db.session.commit()
+        order_id = order.id
+    url = f'/admin/sale/detail/{order_id}'
+    one = statements(app, client, 'admin.sale_detail_view', url)
+
+    with app.app_context():
+        add_items(db.session.get(Order, order_id), MANY)
+        db.session.commit()
+    assert statements(app, client, 'admin.sale_detail_view', url) == one
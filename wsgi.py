@@ -0,0 +1,7 @@
+# Archivo: wsgi.py
+# Punto de entrada de producción: gunicorn -c gunicorn.conf.py wsgi:app
+from app import create_app
+from app.warmup import warmup
+
+app = create_app()
+warmup(app)